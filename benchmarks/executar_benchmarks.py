@@ -0,0 +1,228 @@
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import traceback
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+from benchmarks import hdbcli_falso
+
+FORMATOS = ("xlsx", "csv", "parquet", "db")
+DIRETORIO_RESULTADOS = os.path.join(RAIZ, "benchmarks", "resultados")
+DADOS_CONEXAO = {"HOST": "benchmark", "PORT": 30015, "USUARIO": "benchmark", "SENHA": "benchmark"}
+
+
+def _lista(texto, tipo=str):
+    return [tipo(v.strip()) for v in texto.split(",") if v.strip()]
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark de processar_tarefa com um HANA simulado.")
+    parser.add_argument("--linhas", type=int, default=hdbcli_falso.CONFIG["linhas"])
+    parser.add_argument("--colunas", type=int, default=hdbcli_falso.CONFIG["colunas"])
+    parser.add_argument("--mistura", default=",".join(hdbcli_falso.CONFIG["mistura"]),
+                        help=f"Tipos das colunas, em rodízio. Disponíveis: {', '.join(hdbcli_falso.TIPOS_COLUNA)}.")
+    parser.add_argument("--nulos", type=float, default=hdbcli_falso.CONFIG["nulos"], help="Fração de valores nulos (0 a 1).")
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="Latência simulada por fetchmany.")
+    parser.add_argument("--formatos", default=",".join(FORMATOS))
+    parser.add_argument("--chunk-sizes", default="5000,20000,50000")
+    parser.add_argument("--fetch-modos", default="tuplas", help="tuplas, arrow ou ambos separados por vírgula.")
+    parser.add_argument("--opcoes-tarefa", default="{}", help="JSON mesclado em todas as tarefas (ex: '{\"pipeline\": true}').")
+    parser.add_argument("--repeticoes", type=int, default=1)
+    parser.add_argument("--saida", help="Arquivo JSON de resultados. Padrão: benchmarks/resultados/<data-hora>.json")
+    parser.add_argument("--comparar", help="Resultado anterior para comparar a vazão caso a caso.")
+    return parser.parse_args()
+
+
+def _tamanho(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(r, a)) for r, _, arquivos in os.walk(path) for a in arquivos)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _executar_caso(caso, config_fonte, opcoes_tarefa, diretorio):
+    # Roda num processo novo: o pico de RSS medido pertence só a este caso.
+    hdbcli_falso.instalar(config_fonte)
+    logging.basicConfig(level=logging.WARNING)
+    import sap_sync_main
+    logging.getLogger().setLevel(logging.WARNING)
+
+    formato = caso["formato"]
+    tarefa = {
+        "tabela": "BENCHMARK",
+        "consulta_sap": "SELECT * FROM BENCHMARK",
+        "formato_saida": formato,
+        "arquivo_saida": os.path.join(diretorio, f"benchmark_{caso['fetch_modo']}_{caso['chunk_size']}.{formato}"),
+        "chunk_size": caso["chunk_size"],
+        "fetch_modo": caso["fetch_modo"],
+        **opcoes_tarefa,
+    }
+    resultado = sap_sync_main.executar_tarefa(DADOS_CONEXAO, tarefa)
+    metricas = resultado.metricas
+    return {
+        **caso,
+        "sucesso": metricas["sucesso"],
+        "linhas": metricas["linhas"],
+        "linhas_por_segundo": metricas["linhas_por_segundo"],
+        "duracoes": metricas["duracoes"],
+        "rss_pico_bytes": metricas["rss_pico_bytes"],
+        "chunk_size_final": metricas.get("chunk_size"),
+        "bytes_por_linha": metricas.get("bytes_por_linha"),
+        "tamanho_saida_bytes": _tamanho(tarefa["arquivo_saida"]),
+    }
+
+
+def _rodar_caso(emissor, *args):
+    try:
+        emissor.send(("ok", _executar_caso(*args)))
+    except BaseException:
+        emissor.send(("erro", traceback.format_exc()))
+        raise
+
+
+def _executar_em_processo(contexto, caso, *args):
+    # Um Process comum (não daemon) por caso: a tarefa pode abrir seus próprios processos, como no serviço.
+    receptor, emissor = contexto.Pipe(duplex=False)
+    processo = contexto.Process(target=_rodar_caso, args=(emissor, caso, *args))
+    processo.start()
+    emissor.close()
+    try:
+        status, valor = receptor.recv()
+    except EOFError:
+        status, valor = "erro", "o processo terminou sem devolver o resultado"
+    finally:
+        receptor.close()
+        processo.join()
+    if status != "ok":
+        raise RuntimeError(f"Falha no caso {caso['formato']} fetch={caso['fetch_modo']} chunk={caso['chunk_size']} (código de saída {processo.exitcode}):\n{valor}")
+    return valor
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _ambiente():
+    import openpyxl
+    import pandas
+    import pyarrow
+    return {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "pandas": pandas.__version__,
+        "pyarrow": pyarrow.__version__,
+        "openpyxl": openpyxl.__version__,
+    }
+
+
+def _chave(caso):
+    return (caso["formato"], caso["fetch_modo"], caso["chunk_size"])
+
+
+def _resumir(casos):
+    resumo = {}
+    for caso in casos:
+        resumo.setdefault(_chave(caso), []).append(caso)
+    linhas = []
+    for chave, execucoes in sorted(resumo.items()):
+        ok = [e for e in execucoes if e["sucesso"]]
+        linhas.append({
+            "formato": chave[0],
+            "fetch_modo": chave[1],
+            "chunk_size": chave[2],
+            "sucesso": len(ok) == len(execucoes),
+            "linhas_por_segundo": statistics.median(e["linhas_por_segundo"] or 0 for e in ok) if ok else 0,
+            "total_segundos": statistics.median(e["duracoes"]["total"] for e in ok) if ok else None,
+            "rss_pico_mb": round(max((e["rss_pico_bytes"] or 0) for e in execucoes) / 2 ** 20, 1),
+            "tamanho_saida_mb": round(max(e["tamanho_saida_bytes"] for e in execucoes) / 2 ** 20, 2),
+        })
+    return linhas
+
+
+def _imprimir(resumo, anterior=None):
+    referencia = {_chave(r): r for r in (anterior or [])}
+    print(f"{'formato':<8} {'fetch':<7} {'chunk':>7} {'linhas/s':>12} {'total(s)':>9} {'rss(MB)':>8} {'saída(MB)':>10} {'vs anterior':>12}")
+    for r in resumo:
+        comparacao = ""
+        antes = referencia.get(_chave(r))
+        if antes and antes["linhas_por_segundo"]:
+            variacao = (r["linhas_por_segundo"] / antes["linhas_por_segundo"] - 1) * 100
+            comparacao = f"{variacao:+.1f}%"
+        total = f"{r['total_segundos']:.2f}" if r["total_segundos"] is not None else "falhou"
+        print(f"{r['formato']:<8} {r['fetch_modo']:<7} {r['chunk_size']:>7} {r['linhas_por_segundo']:>12,.0f} {total:>9} {r['rss_pico_mb']:>8} {r['tamanho_saida_mb']:>10} {comparacao:>12}")
+
+
+def main():
+    args = _argumentos()
+    config_fonte = {
+        "linhas": args.linhas,
+        "colunas": args.colunas,
+        "mistura": _lista(args.mistura),
+        "nulos": args.nulos,
+        "latencia_ms": args.latencia_ms,
+    }
+    opcoes_tarefa = json.loads(args.opcoes_tarefa)
+    casos = [
+        {"formato": formato, "fetch_modo": fetch_modo, "chunk_size": chunk_size, "repeticao": repeticao}
+        for formato in _lista(args.formatos)
+        for fetch_modo in _lista(args.fetch_modos)
+        for chunk_size in _lista(args.chunk_sizes, int)
+        for repeticao in range(1, args.repeticoes + 1)
+    ]
+
+    diretorio = tempfile.mkdtemp(prefix="sap_sync_benchmark_")
+    # settings.py exige estas variáveis; o benchmark não usa Firebase nem o tarefas.json.
+    os.environ.setdefault("FIREBASE_CRED_JSON", "benchmark")
+    os.environ.setdefault("SECRET_KEY_FILE", "benchmark")
+    os.environ.setdefault("TAREFAS_JSON_FILE", "benchmark")
+    os.environ["ESTADO_DIR"] = os.path.join(diretorio, "estado")
+    os.environ["METRICAS_LOG_EXECUCOES"] = ""
+
+    contexto = multiprocessing.get_context("spawn")
+    resultados = []
+    try:
+        for i, caso in enumerate(casos, 1):
+            print(f"[{i}/{len(casos)}] {caso['formato']} fetch={caso['fetch_modo']} chunk={caso['chunk_size']} repetição={caso['repeticao']}", flush=True)
+            resultados.append(_executar_em_processo(contexto, caso, config_fonte, opcoes_tarefa, diretorio))
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    resumo = _resumir(resultados)
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            anterior = json.load(f)["resumo"]
+    _imprimir(resumo, anterior)
+
+    saida = args.saida or os.path.join(DIRETORIO_RESULTADOS, datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump({
+            "gerado_em": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": _commit_atual(),
+            "ambiente": _ambiente(),
+            "fonte": config_fonte,
+            "opcoes_tarefa": opcoes_tarefa,
+            "resumo": resumo,
+            "casos": resultados,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Resultados salvos em {saida}")
+
+
+if __name__ == "__main__":
+    main()
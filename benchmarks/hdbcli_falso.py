@@ -0,0 +1,168 @@
+import datetime
+import decimal
+import random
+import sys
+import time
+import types
+
+# Substituto de hdbcli.dbapi para benchmarks: gera resultados sintéticos com o mesmo
+# formato de cursor.description e fetchmany do driver real, sem precisar de um HANA.
+
+TIPOS_COLUNA = {
+    # nome: (type_code HANA, precisão, escala)
+    "int": (3, 10, 0),
+    "bigint": (4, 19, 0),
+    "double": (7, 15, 0),
+    "decimal": (5, 15, 2),
+    "texto": (11, 50, 0),
+    "data": (14, 10, 0),
+    "timestamp": (16, 27, 7),
+}
+
+CONFIG = {
+    "linhas": 100000,
+    "colunas": 12,
+    "mistura": ["int", "decimal", "texto", "timestamp", "double", "data"],
+    "nulos": 0.05,
+    "latencia_ms": 0.0,
+    "semente": 42,
+    "bloco": 10000,
+}
+
+
+class Error(Exception):
+    pass
+
+
+def _gerador_valor(tipo, rnd):
+    base = datetime.datetime(2020, 1, 1)
+    if tipo in ("int", "bigint"):
+        return lambda i: rnd.randint(0, 10 ** 6)
+    if tipo == "double":
+        return lambda i: rnd.random() * 10 ** 4
+    if tipo == "decimal":
+        return lambda i: decimal.Decimal(rnd.randint(0, 10 ** 9)).scaleb(-2)
+    if tipo == "texto":
+        palavras = [f"valor_{n:04d}" for n in range(500)]
+        return lambda i: rnd.choice(palavras)
+    if tipo == "data":
+        return lambda i: (base + datetime.timedelta(days=rnd.randint(0, 2000))).date()
+    if tipo == "timestamp":
+        return lambda i: base + datetime.timedelta(seconds=rnd.randint(0, 10 ** 8))
+    raise ValueError(f"Tipo de coluna '{tipo}' desconhecido. Use um de {', '.join(TIPOS_COLUNA)}.")
+
+
+def _colunas(config):
+    mistura = config["mistura"]
+    return [("ID", "bigint")] + [
+        (f"COL_{i:02d}_{mistura[i % len(mistura)].upper()}", mistura[i % len(mistura)])
+        for i in range(config["colunas"] - 1)
+    ]
+
+
+def _descricao(colunas):
+    descricao = []
+    for nome, tipo in colunas:
+        type_code, precisao, escala = TIPOS_COLUNA[tipo]
+        descricao.append((nome, type_code, None, precisao, precisao, escala, 1))
+    return descricao
+
+
+def _bloco(colunas, config):
+    # Um bloco fixo de linhas é gerado uma vez e reaproveitado, para que o custo do
+    # gerador não contamine a medição do caminho de busca/transformação/escrita.
+    rnd = random.Random(config["semente"])
+    geradores = [_gerador_valor(tipo, rnd) for _, tipo in colunas[1:]]
+    nulos = config["nulos"]
+    linhas = []
+    for i in range(config["bloco"]):
+        valores = [None if nulos and rnd.random() < nulos else g(i) for g in geradores]
+        linhas.append(tuple(valores))
+    return linhas
+
+
+class Cursor:
+    def __init__(self, conexao):
+        self._conexao = conexao
+        self.description = None
+        self._resultado = None
+        self._fixas = None
+        self._posicao = 0
+        self._total = 0
+
+    def execute(self, consulta, parametros=None):
+        if "DUMMY" in consulta.upper():
+            self.description = [("X", 3, None, 10, 10, 0, 1)]
+            self._fixas = [(1,)]
+            self._total = 1
+        else:
+            config = self._conexao.config
+            colunas = _colunas(config)
+            self.description = _descricao(colunas)
+            self._fixas = None
+            self._resultado = self._conexao.bloco(colunas)
+            self._total = config["linhas"]
+        self._posicao = 0
+
+    def fetchmany(self, tamanho):
+        latencia = self._conexao.config["latencia_ms"]
+        if latencia:
+            time.sleep(latencia / 1000)
+        fim = min(self._total, self._posicao + tamanho)
+        if self._fixas is not None:
+            linhas = self._fixas[self._posicao:fim]
+        else:
+            tamanho_bloco = len(self._resultado)
+            linhas = [
+                (i,) + self._resultado[i % tamanho_bloco]
+                for i in range(self._posicao, fim)
+            ]
+        self._posicao = fim
+        return linhas
+
+    def fetchone(self):
+        linhas = self.fetchmany(1)
+        return linhas[0] if linhas else None
+
+    def fetchall(self):
+        return self.fetchmany(self._total - self._posicao)
+
+    def close(self):
+        self._resultado = None
+
+
+class Conexao:
+    def __init__(self, config):
+        self.config = config
+        self._bloco = None
+        self._aberta = True
+
+    def bloco(self, colunas):
+        if self._bloco is None:
+            self._bloco = _bloco(colunas, self.config)
+        return self._bloco
+
+    def cursor(self):
+        if not self._aberta:
+            raise Error("Conexão fechada.")
+        return Cursor(self)
+
+    def isconnected(self):
+        return self._aberta
+
+    def close(self):
+        self._aberta = False
+
+
+def connect(**kwargs):
+    return Conexao(CONFIG)
+
+
+def instalar(config=None):
+    if config:
+        CONFIG.update(config)
+    dbapi = sys.modules[__name__]
+    pacote = types.ModuleType("hdbcli")
+    pacote.dbapi = dbapi
+    sys.modules["hdbcli"] = pacote
+    sys.modules["hdbcli.dbapi"] = dbapi
@@ -1,26 +1,37 @@
+import json
 import logging
-import firebase_admin
-from firebase_admin import credentials, firestore
-from cryptography.fernet import Fernet
-from .settings import FIREBASE_CRED_JSON, SECRET_KEY_FILE
+import os
+import tempfile
+import threading
+import time
+from cryptography.fernet import Fernet, InvalidToken
+from .settings import FIREBASE_CRED_JSON, SECRET_KEY_FILE, CREDENCIAIS
+
+ERRO_RENOVACAO_INTERVALO = 300
+
+def _fernet():
+    with open(SECRET_KEY_FILE, "rb") as key_file:
+        key = key_file.read()
+    return Fernet(key)
+
+def buscar_credenciais_firebase():
+    # firebase_admin é pesado; só é importado quando o cache local não basta.
+    import firebase_admin
+    from firebase_admin import credentials, firestore
 
-def obter_credenciais_sap():
     logging.info("Inicializando conexão com Firebase para obter credenciais SAP...")
     if not firebase_admin._apps:
         cred = credentials.Certificate(FIREBASE_CRED_JSON)
         firebase_admin.initialize_app(cred)
 
     db = firestore.client()
-
-    with open(SECRET_KEY_FILE, "rb") as key_file:
-        key = key_file.read()
-    fernet = Fernet(key)
+    fernet = _fernet()
 
     doc_ref = db.collection("configuracoes").document("conexao")
     doc = doc_ref.get()
     if not doc.exists:
         raise RuntimeError("Documento 'configuracoes/conexao' não encontrado no Firestore.")
-    
+
     dados_enc = doc.to_dict()
     dados = {}
     for k, v in dados_enc.items():
@@ -28,6 +39,150 @@ def obter_credenciais_sap():
             dados[k] = None
         else:
             dados[k] = fernet.decrypt(v.encode()).decode()
-            
+
     logging.info("Credenciais SAP obtidas e descriptografadas.")
-    return dados
\ No newline at end of file
+    return dados
+
+class ProvedorCredenciais:
+    # Mantém as credenciais SAP em memória e num cache local criptografado com a mesma chave do Firestore.
+    # O Firebase só é consultado sem cache válido, quando o TTL vence ou quando o HANA recusa a senha.
+    def __init__(self, caminho_cache, ttl):
+        self.caminho_cache = caminho_cache
+        self.ttl = ttl
+        self._dados = None
+        self._obtidas_em = 0
+        self._mtime_cache = None
+        self._lock = threading.Lock()
+        self._lock_renovacao = threading.RLock()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _ler_cache(self):
+        if not self.caminho_cache:
+            return False
+        try:
+            mtime = os.stat(self.caminho_cache).st_mtime_ns
+            if mtime == self._mtime_cache:
+                return False
+            with open(self.caminho_cache, "rb") as f:
+                conteudo = json.loads(_fernet().decrypt(f.read()))
+        except FileNotFoundError:
+            return False
+        except (OSError, InvalidToken, ValueError) as e:
+            logging.warning(f"Cache de credenciais '{self.caminho_cache}' ilegível. Ele será ignorado. Detalhes: {e}")
+            return False
+        self._mtime_cache = mtime
+        if conteudo["obtidas_em"] <= self._obtidas_em:
+            return False
+        self._dados = conteudo["dados"]
+        self._obtidas_em = conteudo["obtidas_em"]
+        return True
+
+    def _gravar_cache(self):
+        if not self.caminho_cache:
+            return
+        diretorio = os.path.dirname(os.path.abspath(self.caminho_cache))
+        os.makedirs(diretorio, exist_ok=True)
+        token = _fernet().encrypt(json.dumps({"obtidas_em": self._obtidas_em, "dados": self._dados}).encode())
+        tmp_file = None
+        try:
+            with tempfile.NamedTemporaryFile('wb', delete=False, dir=diretorio, suffix=".tmp") as tmp:
+                tmp_file = tmp.name
+                tmp.write(token)
+            os.chmod(tmp_file, 0o600)
+            os.replace(tmp_file, self.caminho_cache)
+            tmp_file = None
+            self._mtime_cache = os.stat(self.caminho_cache).st_mtime_ns
+        except OSError as e:
+            logging.warning(f"Não foi possível gravar o cache de credenciais '{self.caminho_cache}'. Detalhes: {e}")
+        finally:
+            if tmp_file and os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def _expiradas(self):
+        return time.time() - self._obtidas_em >= self.ttl
+
+    def renovar(self):
+        # A busca no Firebase fica fora de _lock para não travar quem só lê as credenciais atuais.
+        with self._lock_renovacao:
+            dados = buscar_credenciais_firebase()
+            with self._lock:
+                alteradas = self._dados is not None and dados != self._dados
+                self._dados = dados
+                self._obtidas_em = time.time()
+                self._gravar_cache()
+            if alteradas:
+                logging.info("Credenciais SAP renovadas: houve alteração desde a última leitura.")
+            return dict(dados)
+
+    def obter(self):
+        with self._lock:
+            # Outro processo (worker ou reinício) pode ter renovado o cache em disco.
+            self._ler_cache()
+            dados = self._dados
+            expiradas = self._expiradas()
+        if dados is None:
+            return self.renovar()
+        if expiradas and not self._renovacao_ativa():
+            try:
+                return self.renovar()
+            except Exception as e:
+                logging.warning(f"Falha ao renovar as credenciais SAP; usando as do cache. Detalhes: {e}")
+        return dict(dados)
+
+    def renovar_apos_recusa(self, recusadas):
+        # Chamado quando o HANA recusa as credenciais: primeiro tenta o que outra thread ou processo já renovou.
+        with self._lock_renovacao:
+            with self._lock:
+                self._ler_cache()
+                if self._dados is not None and self._dados != recusadas:
+                    return dict(self._dados)
+            logging.warning("Credenciais SAP recusadas pelo HANA. Buscando credenciais atualizadas no Firebase.")
+            return self.renovar()
+
+    def _renovacao_ativa(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _renovar_periodicamente(self):
+        espera = 0
+        while not self._parar.wait(espera):
+            with self._lock:
+                self._ler_cache()
+                restante = self._obtidas_em + self.ttl - time.time()
+            if restante > 0:
+                espera = restante
+                continue
+            try:
+                self.renovar()
+                espera = self.ttl
+            except Exception as e:
+                espera = min(self.ttl, ERRO_RENOVACAO_INTERVALO)
+                logging.warning(f"Falha na renovação das credenciais SAP em segundo plano. Nova tentativa em {espera}s. Detalhes: {e}")
+
+    def iniciar_renovacao(self):
+        if self._renovacao_ativa():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._renovar_periodicamente, name="renovacao-credenciais", daemon=True)
+        self._thread.start()
+
+    def parar_renovacao(self):
+        self._parar.set()
+
+_provedor = None
+_provedor_pid = None
+_provedor_lock = threading.Lock()
+
+def obter_provedor():
+    global _provedor, _provedor_pid
+    with _provedor_lock:
+        if _provedor is None or _provedor_pid != os.getpid():
+            _provedor = ProvedorCredenciais(CREDENCIAIS["cache"], CREDENCIAIS["ttl"])
+            _provedor_pid = os.getpid()
+        return _provedor
+
+def obter_credenciais_sap():
+    return obter_provedor().obter()
+
+def renovar_credenciais_recusadas(recusadas):
+    return obter_provedor().renovar_apos_recusa(recusadas)
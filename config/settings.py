@@ -11,9 +11,65 @@ HORARIO_PERMITIDO = {
     "hora_fim": 19,
 }
 
+EXECUCAO = {
+    "modo": os.getenv("EXECUCAO_MODO", "serial"),
+    "max_workers": int(os.getenv("EXECUCAO_MAX_WORKERS", "4")),
+}
+
+TAREFAS_VERIFICACAO_INTERVALO = int(os.getenv("TAREFAS_VERIFICACAO_INTERVALO", "5"))
+TAREFAS_JITTER_INICIO = float(os.getenv("TAREFAS_JITTER_INICIO", "30"))
+
+CHUNK_AUTO = {
+    "inicial": int(os.getenv("CHUNK_AUTO_INICIAL", "10000")),
+    "minimo": int(os.getenv("CHUNK_AUTO_MINIMO", "1000")),
+    "maximo": int(os.getenv("CHUNK_AUTO_MAXIMO", "500000")),
+    "memoria_mb": float(os.getenv("CHUNK_AUTO_MEMORIA_MB", "64")),
+    "latencia_alvo": float(os.getenv("CHUNK_AUTO_LATENCIA_ALVO", "2.0")),
+}
+
+PIPELINE_PROFUNDIDADE_FILA = int(os.getenv("PIPELINE_PROFUNDIDADE_FILA", "4"))
+
+SQLITE_BULK_PRAGMAS = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "cache_size": -262144,
+    "temp_store": "MEMORY",
+}
+SQLITE_BULK_PAGE_SIZE = int(os.getenv("SQLITE_BULK_PAGE_SIZE", "16384"))
+
+CSV_ESCRITA = {
+    # "auto": processos com o motor pandas (que segura o GIL ao formatar) e threads com o motor arrow.
+    "modo": os.getenv("CSV_ESCRITA_MODO", "auto"),
+    "paralelismo": int(os.getenv("CSV_ESCRITA_PARALELISMO", str(min(4, os.cpu_count() or 1)))),
+}
+
+POOL_SAP = {
+    "tamanho_max": int(os.getenv("POOL_SAP_TAMANHO_MAX", "4")),
+    "timeout_ocioso": int(os.getenv("POOL_SAP_TIMEOUT_OCIOSO", "300")),
+    "timeout_checkout": int(os.getenv("POOL_SAP_TIMEOUT_CHECKOUT", "120")),
+}
+
 FIREBASE_CRED_JSON = os.getenv("FIREBASE_CRED_JSON")
 SECRET_KEY_FILE = os.getenv("SECRET_KEY_FILE")
 TAREFAS_JSON_FILE = os.getenv("TAREFAS_JSON_FILE")
+ESTADO_DIR = os.getenv("ESTADO_DIR", ".sync_estado")
+
+CREDENCIAIS = {
+    "cache": os.getenv("CREDENCIAIS_CACHE", os.path.join(ESTADO_DIR, "credenciais.enc")),
+    "ttl": int(os.getenv("CREDENCIAIS_TTL", "3600")),
+}
+
+CACHE_RESULTADOS = {
+    "diretorio": os.getenv("CACHE_RESULTADOS_DIR", os.path.join(ESTADO_DIR, "cache_resultados")),
+    "tamanho_max_mb": float(os.getenv("CACHE_RESULTADOS_TAMANHO_MAX_MB", "1024")),
+    "ttl": int(os.getenv("CACHE_RESULTADOS_TTL", "300")),
+}
+
+METRICAS = {
+    "porta": int(os.getenv("METRICAS_PORTA")) if os.getenv("METRICAS_PORTA") else None,
+    "endereco": os.getenv("METRICAS_ENDERECO", "127.0.0.1"),
+    "log_execucoes": os.getenv("METRICAS_LOG_EXECUCOES", os.path.join(ESTADO_DIR, "execucoes.jsonl")),
+}
 
 if not all([FIREBASE_CRED_JSON, SECRET_KEY_FILE, TAREFAS_JSON_FILE]):
     raise ValueError("Uma ou mais variáveis de ambiente essenciais não foram definidas!")
@@ -39,6 +95,13 @@ def carregar_tarefas():
         logging.exception(f"Erro inesperado ao carregar as tarefas: {e}")
         return None
 
+def identificador_tarefa(tarefa):
+    if tarefa.get("id"):
+        return str(tarefa["id"])
+    formato = tarefa.get("formato_saida", "xlsx")
+    arquivo = tarefa.get("arquivo_saida") or f"{tarefa['tabela']}.{formato}"
+    return f"{arquivo}::{tarefa['tabela']}"
+
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     tarefas_carregadas = carregar_tarefas()
@@ -0,0 +1,123 @@
+import collections
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from config.settings import CSV_ESCRITA
+from processing.parquet_dataset import tabela_arrow
+
+COMPRESSOES_CSV = ("none", "gzip", "zstd")
+MOTORES_CSV = ("pandas", "arrow")
+MODOS_CSV = ("auto", "thread", "process")
+TAMANHO_BUFFER_CSV = 1024 * 1024
+
+
+def _formatar_pandas(chunk, cabecalho):
+    if isinstance(chunk, (pa.Table, pa.RecordBatch)):
+        chunk = chunk.to_pandas()
+    return chunk.to_csv(index=False, header=cabecalho, lineterminator='\n').encode('utf-8')
+
+
+def _formatar_arrow(tabela, cabecalho):
+    sink = pa.BufferOutputStream()
+    pacsv.write_csv(tabela, sink, pacsv.WriteOptions(include_header=cabecalho))
+    return sink.getvalue()
+
+
+def _codificar(chunk, cabecalho, motor, compressao, nivel):
+    # Função de módulo para poder rodar também num ProcessPoolExecutor.
+    if motor == "arrow":
+        dados = _formatar_arrow(chunk, cabecalho)
+    else:
+        dados = _formatar_pandas(chunk, cabecalho)
+    if compressao != "none":
+        dados = pa.Codec(compressao, compression_level=nivel).compress(dados)
+    return dados
+
+
+def _contexto_processos():
+    # Sem fork: o serviço tem outras threads (observador, métricas, tarefas no modo thread) que podem estar
+    # segurando locks no momento do fork. O forkserver já deixa este módulo importado para os workers.
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    contexto = multiprocessing.get_context("forkserver")
+    contexto.set_forkserver_preload([__name__])
+    return contexto
+
+
+def compressao_csv(opcoes):
+    compressao = (opcoes or {}).get("compressao") or "none"
+    if compressao not in COMPRESSOES_CSV:
+        raise ValueError(f"compressao '{compressao}' não suportada em csv_options (use {', '.join(COMPRESSOES_CSV)}).")
+    return compressao
+
+
+class EscritorCsv:
+    # Formata (e comprime) os chunks em paralelo e grava os blocos na ordem original num único handle.
+    # Com compressão, cada chunk vira um membro gzip / frame zstd próprio; gzip, zstd e pandas leem a concatenação.
+    def __init__(self, path, opcoes=None):
+        opcoes = opcoes or {}
+        self.path = path
+        self.motor = opcoes.get("motor", "pandas")
+        if self.motor not in MOTORES_CSV:
+            raise ValueError(f"motor '{self.motor}' não suportado em csv_options (use {', '.join(MOTORES_CSV)}).")
+        modo = opcoes.get("modo_paralelo", CSV_ESCRITA["modo"])
+        if modo not in MODOS_CSV:
+            raise ValueError(f"modo_paralelo '{modo}' não suportado em csv_options (use {', '.join(MODOS_CSV)}).")
+        # O to_csv do pandas segura o GIL: só processos formatam em vários núcleos. O pyarrow.csv libera o GIL.
+        self.modo = modo if modo != "auto" else ("process" if self.motor == "pandas" else "thread")
+        if self.modo == "process" and multiprocessing.current_process().daemon:
+            # Processos daemon (ex: workers de um multiprocessing.Pool) não podem criar filhos.
+            if modo == "process":
+                logging.warning("modo_paralelo 'process' não é suportado dentro de um processo daemon. O CSV será formatado em threads.")
+            self.modo = "thread"
+        self.compressao = compressao_csv(opcoes)
+        self.nivel_compressao = opcoes.get("nivel_compressao")
+        self.paralelismo = max(1, int(opcoes.get("paralelismo") or CSV_ESCRITA["paralelismo"]))
+
+        self.linhas = 0
+        self._cabecalho = True
+        self._schema = None
+        self._pendentes = collections.deque()
+        self._pool = None
+        if self.paralelismo > 1 and self.modo == "process":
+            self._pool = ProcessPoolExecutor(max_workers=self.paralelismo, mp_context=_contexto_processos())
+        elif self.paralelismo > 1:
+            self._pool = ThreadPoolExecutor(max_workers=self.paralelismo, thread_name_prefix="csv")
+        self._arquivo = open(path, 'wb', buffering=TAMANHO_BUFFER_CSV)
+
+    def _descarregar(self, limite):
+        while len(self._pendentes) > limite:
+            self._arquivo.write(self._pendentes.popleft().result())
+
+    def escrever(self, chunk):
+        if self.motor == "arrow":
+            # O schema do primeiro chunk vale para os demais, como no parquet.
+            chunk, self._schema = tabela_arrow(chunk, self._schema)
+        self.linhas += chunk.num_rows if isinstance(chunk, (pa.Table, pa.RecordBatch)) else len(chunk)
+        args = (chunk, self._cabecalho, self.motor, self.compressao, self.nivel_compressao)
+        self._cabecalho = False
+
+        if self._pool is None:
+            self._arquivo.write(_codificar(*args))
+            return
+        self._pendentes.append(self._pool.submit(_codificar, *args))
+        # Limita os chunks em memória: no máximo dois por worker aguardando a gravação.
+        self._descarregar(self.paralelismo * 2)
+
+    def fechar(self):
+        try:
+            self._descarregar(0)
+        finally:
+            self.abortar()
+
+    def abortar(self):
+        for futuro in self._pendentes:
+            futuro.cancel()
+        self._pendentes.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        if not self._arquivo.closed:
+            self._arquivo.close()
@@ -1,24 +1,95 @@
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+TIPOS_ARROW = {
+    'force_text': pa.string(),
+    'force_numeric': pa.float64(),
+    'force_integer': pa.int64(),
+    'force_date': pa.timestamp('us'),
+}
+
+FORMATO_DATAHORA_TEXTO = '%Y-%m-%d %H:%M:%S'
+
+def texto_arrow(arr):
+    # Mesmo texto de str(valor) do tratamento original, calculado no Arrow/numpy em vez de valor a valor.
+    tipo = arr.type
+    if pa.types.is_timestamp(tipo):
+        # str(Timestamp) sempre tem os segundos e só mostra os microssegundos quando eles não são zero.
+        segundos = pc.strftime(pc.cast(arr, pa.timestamp('s', tipo.tz), safe=False), format=FORMATO_DATAHORA_TEXTO)
+        micro = pc.add(pc.multiply(pc.millisecond(arr), 1000), pc.microsecond(arr))
+        fracao = pc.utf8_lpad(pc.cast(micro, pa.string()), 6, '0')
+        return pc.if_else(pc.equal(micro, 0), segundos, pc.binary_join_element_wise(segundos, fracao, '.'))
+    if pa.types.is_floating(tipo):
+        # O numpy formata floats como repr() (1.0, 1e+20); o cast do Arrow escreveria "1".
+        valores = arr.to_numpy(zero_copy_only=False).astype(str)
+        return pa.array(valores, type=pa.string(), mask=arr.is_null().to_numpy(zero_copy_only=False))
+    if pa.types.is_boolean(tipo):
+        return pc.if_else(arr, 'True', 'False')
+    return pc.cast(arr, pa.string())
+
+def _para_texto(s):
+    if s.dtype.kind in 'Mf' and not isinstance(s.dtype, pd.DatetimeTZDtype):
+        texto = texto_arrow(pa.Array.from_pandas(s))
+        return pd.Series(texto.to_numpy(zero_copy_only=False), index=s.index, dtype='string')
+    return s.astype('string')
+
+CONVERSORES = {
+    'force_text': _para_texto,
+    'force_numeric': lambda s: pd.to_numeric(s, errors='coerce'),
+    'force_integer': lambda s: pd.to_numeric(s, errors='coerce').astype('Int64'),
+    'force_date': lambda s: pd.to_datetime(s, errors='coerce'),
+}
+
+class PlanoFormatacao:
+    def __init__(self, options=None):
+        options = options or {}
+        self.conversoes = {}
+        # Mesma precedência do tratamento original: texto > numérico > inteiro > data.
+        for tipo in ('force_date', 'force_integer', 'force_numeric', 'force_text'):
+            for col in options.get(tipo, []):
+                self.conversoes[col] = tipo
+
+    def aplicar(self, df):
+        for col, tipo in self.conversoes.items():
+            if col in df.columns:
+                df[col] = CONVERSORES[tipo](df[col])
+        return df
+
+    def tipo_arrow(self, col):
+        tipo = self.conversoes.get(col)
+        return TIPOS_ARROW[tipo] if tipo else None
+
+    def _converter_array(self, col, arr):
+        tipo = self.tipo_arrow(col)
+        if arr.type == tipo:
+            return arr
+        try:
+            if self.conversoes[col] == 'force_text':
+                return texto_arrow(arr)
+            return pc.cast(arr, tipo)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            serie = CONVERSORES[self.conversoes[col]](arr.to_pandas())
+            return pa.Array.from_pandas(serie, type=tipo)
+
+    def aplicar_arrow(self, batch):
+        colunas = [c for c in self.conversoes if c in batch.schema.names]
+        if not colunas:
+            return batch
+        arrays = []
+        for i, nome in enumerate(batch.schema.names):
+            arr = batch.column(i)
+            arrays.append(self._converter_array(nome, arr) if nome in self.conversoes else arr)
+        return pa.RecordBatch.from_arrays(arrays, names=batch.schema.names)
+
+def reindexar_colunas(batch, colunas):
+    arrays = []
+    for col in colunas:
+        if col in batch.schema.names:
+            arrays.append(batch.column(col))
+        else:
+            arrays.append(pa.nulls(batch.num_rows, type=pa.string()))
+    return pa.RecordBatch.from_arrays(arrays, names=list(colunas))
 
 def aplicar_formatacoes_df(df, options=None):
-    if options is None:
-        options = {}
-    
-    df2 = df.copy()
-
-    force_text = set(options.get('force_text', []))
-    force_numeric = set(options.get('force_numeric', []))
-    force_integer = set(options.get('force_integer', []))
-    force_date = set(options.get('force_date', []))
-
-    for col in df2.columns:
-        if col in force_text:
-            df2[col] = df2[col].astype(object).where(df2[col].notna(), None).apply(lambda x: str(x) if x is not None else x)
-        elif col in force_numeric:
-            df2[col] = pd.to_numeric(df2[col], errors='coerce')
-        elif col in force_integer:
-            df2[col] = pd.to_numeric(df2[col], errors='coerce').astype('Int64')
-        elif col in force_date:
-            df2[col] = pd.to_datetime(df2[col], errors='coerce')
-            
-    return df2
\ No newline at end of file
+    return PlanoFormatacao(options).aplicar(df.copy(deep=False))
@@ -1,108 +1,261 @@
 import os
 import logging
 import tempfile
+import csv
+import decimal
+import shutil
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import sqlite3
 from sqlite3 import Error as SqliteError
-import shutil
+from config.settings import SQLITE_BULK_PAGE_SIZE
+from processing.parquet_dataset import (
+    DatasetParticionado,
+    EscritorParquet,
+    chaves_presentes,
+    filtrar_por_chaves,
+    mesclar_particoes,
+    particionado,
+    tabela_arrow,
+)
+from processing.xlsx_pacote import PlanilhaXml, publicar_planilhas
+from processing.csv_paralelo import EscritorCsv, compressao_csv
+from processing.sqlite_bulk import aplicar_pragmas, carregar_chunks, criar_indices, pragmas_bulk
 
-def salvar_xlsx_atomic(path, df_chunks, sheet_name):
+sqlite3.register_adapter(decimal.Decimal, float)
 
-    tmp_file = None
+class EscritaDescartada(Exception):
+    pass
+
+def _garantir_diretorio(path):
+    diretorio = os.path.dirname(path)
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+
+def _para_dataframe(chunk):
+    if isinstance(chunk, (pa.Table, pa.RecordBatch)):
+        return chunk.to_pandas()
+    return chunk
+
+def _escrever_chunks_xlsx(planilha, df_chunks):
     total_rows = 0
-    sheet_name_to_use = sheet_name or 'data'
-    
-    try:
-        full_df = pd.concat(df_chunks, ignore_index=True)
-        total_rows = len(full_df)
+    header = True
+    for df_chunk in map(_para_dataframe, df_chunks):
+        if header:
+            planilha.append([str(c) for c in df_chunk.columns])
+            header = False
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx", prefix="sync_") as tmp:
-            tmp_file = tmp.name
+        colunas_data = [i for i, dtype in enumerate(df_chunk.dtypes) if dtype.kind == 'M']
+        valores = df_chunk.astype(object).where(df_chunk.notna(), None)
+        for linha in valores.itertuples(index=False, name=None):
+            if colunas_data:
+                linha = list(linha)
+                for i in colunas_data:
+                    if linha[i] is not None:
+                        linha[i] = linha[i].to_pydatetime()
+            planilha.append(linha)
+        total_rows += len(df_chunk)
+    return total_rows
 
-        file_exists = os.path.exists(path)
-        if file_exists:
-            shutil.copy(path, tmp_file)
-            
-        mode = 'a' if file_exists else 'w'
-        
-        with pd.ExcelWriter(tmp_file, 
-                              engine='openpyxl', 
-                              mode=mode, 
-                              if_sheet_exists='replace', 
-                              datetime_format='YYYY-MM-DD HH:MM:SS') as writer:
-            
-            full_df.to_excel(writer, index=False, sheet_name=sheet_name_to_use, header=True)
-            
-            if not file_exists and 'Sheet' in writer.book.sheetnames and sheet_name_to_use != 'Sheet':
-                del writer.book['Sheet']
-        
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        os.replace(tmp_file, path)
-        logging.info(f"Arquivo salvo: {path} (Planilha: '{sheet_name_to_use}', total de linhas={total_rows})")
+class EscritorWorkbookXlsx:
+    # Cada planilha das tarefas vira um XML próprio, com textos inline; ao publicar, elas entram numa cópia
+    # do pacote .xlsx atual. As demais planilhas são copiadas sem serem lidas, com estilos, mesclagens e larguras.
+    def __init__(self, path):
+        self.path = path
+        self.planilhas = {}
+        self.linhas = {}
+        self.inalteradas = set()
+        # Estados (watermark, fingerprint) só são gravados depois que o arquivo for publicado.
+        self.confirmacoes = []
+
+    def escrever_planilha(self, sheet_name, df_chunks):
+        nome = sheet_name or 'data'
+        self._remover_planilha(nome)
+
+        planilha = None
+        try:
+            planilha = PlanilhaXml(nome)
+            linhas = _escrever_chunks_xlsx(planilha, df_chunks)
+            planilha.fechar()
+        except EscritaDescartada as e:
+            logging.info(f"Planilha '{nome}' de '{self.path}' inalterada: {e}")
+            planilha.descartar()
+            self.linhas[nome] = None
+            self.inalteradas.add(nome)
+            return True
+        except Exception as e:
+            logging.exception(f"Falha ao salvar o arquivo XLSX '{self.path}' (Planilha: '{nome}'): {e}")
+            if planilha is not None:
+                planilha.descartar()
+            return False
+
+        # A planilha anterior (no arquivo atual) só é substituída ao publicar, e só se esta foi escrita até o fim.
+        self.planilhas[nome] = planilha
+        self.linhas[nome] = linhas
         return True
-    except Exception as e:
-        logging.exception(f"Falha ao salvar o arquivo XLSX '{path}' (Planilha: '{sheet_name_to_use}'): {e}")
-        return False
+
+    def _remover_planilha(self, nome):
+        planilha = self.planilhas.pop(nome, None)
+        if planilha is not None:
+            planilha.descartar()
+        self.linhas.pop(nome, None)
+        self.inalteradas.discard(nome)
+
+    def _confirmar(self):
+        for confirmar in self.confirmacoes:
+            confirmar()
+        self.confirmacoes = []
+        return True
+
+    def publicar(self):
+        if not self.planilhas:
+            if self.linhas:
+                logging.info(f"Escrita de '{self.path}' ignorada: nenhuma planilha alterada.")
+            return self._confirmar()
+
+        tmp_file = None
+        try:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx", prefix="sync_") as tmp:
+                tmp_file = tmp.name
+
+            origem = self.path if os.path.exists(self.path) else None
+            publicar_planilhas(origem, tmp_file, list(self.planilhas.values()))
+
+            _garantir_diretorio(self.path)
+            os.replace(tmp_file, self.path)
+            resumo = ", ".join(f"'{n}'={l if l is not None else 'inalterada'}" for n, l in self.linhas.items())
+            logging.info(f"Arquivo salvo: {self.path} (Planilhas escritas: {resumo})")
+            return self._confirmar()
+        except Exception as e:
+            logging.exception(f"Falha ao salvar o arquivo XLSX '{self.path}': {e}")
+            return False
+        finally:
+            if tmp_file and os.path.exists(tmp_file):
+                try:
+                    os.remove(tmp_file)
+                except OSError:
+                    pass
+
+    def descartar(self):
+        for planilha in self.planilhas.values():
+            planilha.descartar()
+        self.planilhas = {}
+
+def salvar_xlsx_atomic(path, df_chunks, sheet_name):
+    escritor = EscritorWorkbookXlsx(path)
+    try:
+        return escritor.escrever_planilha(sheet_name, df_chunks) and escritor.publicar()
     finally:
-        if tmp_file and os.path.exists(tmp_file):
-            try:
-                os.remove(tmp_file)
-            except OSError:
-                pass
+        escritor.descartar()
 
-def salvar_csv_atomic(path, df_chunks):
+def salvar_csv_atomic(path, df_chunks, opcoes=None):
     tmp_file = None
-    total_rows = 0
+    escritor = None
     try:
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix=".csv", prefix="sync_", encoding='utf-8') as tmp:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv", prefix="sync_") as tmp:
             tmp_file = tmp.name
 
-        header = True
+        escritor = EscritorCsv(tmp_file, opcoes)
         for df_chunk in df_chunks:
-            df_chunk.to_csv(tmp_file, index=False, header=header, mode='a', lineterminator='\n')
-            total_rows += len(df_chunk)
-            header = False
+            escritor.escrever(df_chunk)
+        escritor.fechar()
+        total_rows = escritor.linhas
+        escritor = None
 
+        _garantir_diretorio(path)
         os.replace(tmp_file, path)
         logging.info(f"Arquivo salvo: {path} (total de linhas={total_rows})")
         return True
+    except EscritaDescartada as e:
+        logging.info(f"Escrita de '{path}' ignorada: {e}")
+        return True
     except Exception as e:
         logging.exception(f"Falha ao salvar o arquivo CSV em chunks '{path}': {e}")
         return False
     finally:
+        if escritor is not None:
+            escritor.abortar()
         if tmp_file and os.path.exists(tmp_file):
             try:
                 os.remove(tmp_file)
             except OSError:
                 pass
 
-def salvar_parquet_atomic(path, df_chunks):
+def salvar_parquet_atomic(path, df_chunks, opcoes=None):
+    if particionado(opcoes):
+        return salvar_parquet_particionado_atomic(path, df_chunks, opcoes)
+
     tmp_file = None
+    escritor = None
     total_rows = 0
     try:
-        full_df = pd.concat(df_chunks, ignore_index=True)
-        total_rows = len(full_df)
-
         with tempfile.NamedTemporaryFile(delete=False, suffix=".parquet", prefix="sync_") as tmp:
             tmp_file = tmp.name
         
-        full_df.to_parquet(tmp_file, index=False, engine='pyarrow')
+        schema = None
+        for df_chunk in df_chunks:
+            tabela, schema = tabela_arrow(df_chunk, schema)
+            if escritor is None:
+                escritor = EscritorParquet(tmp_file, schema, opcoes)
+            escritor.escrever(tabela)
+            total_rows += len(df_chunk)
 
-        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if escritor is None:
+            escritor = EscritorParquet(tmp_file, pa.schema([]), opcoes)
+        escritor.fechar()
+        escritor = None
+
+        _garantir_diretorio(path)
 
         os.replace(tmp_file, path)
         logging.info(f"Arquivo salvo: {path} (total de linhas={total_rows})")
         return True
+    except EscritaDescartada as e:
+        logging.info(f"Escrita de '{path}' ignorada: {e}")
+        return True
     except Exception as e:
         logging.exception(f"Falha ao salvar o arquivo Parquet '{path}': {e}")
         return False
     finally:
+        if escritor is not None:
+            escritor.abortar()
         if tmp_file and os.path.exists(tmp_file):
             try:
                 os.remove(tmp_file)
             except OSError:
                 pass
 
+def salvar_parquet_particionado_atomic(path, df_chunks, opcoes, chaves=None, mesclar=False):
+    dataset = None
+    try:
+        dataset = DatasetParticionado(path, opcoes)
+        for df_chunk in df_chunks:
+            dataset.escrever(df_chunk)
+        dataset.fechar_escritores()
+
+        particoes = dataset.particoes_staging()
+        mantidas = 0
+        if mesclar and os.path.isdir(path):
+            mantidas = mesclar_particoes(dataset, chaves)
+        removidas = dataset.publicar(particoes, remover_ausentes=not mesclar)
+
+        if mesclar:
+            logging.info(f"Dataset mesclado: {path} (partições afetadas={len(particoes)}, linhas novas/alteradas={dataset.linhas}, linhas mantidas={mantidas})")
+        else:
+            logging.info(f"Dataset salvo: {path} (partições={len(particoes)}, partições removidas={removidas}, total de linhas={dataset.linhas})")
+        return True
+    except EscritaDescartada as e:
+        logging.info(f"Escrita de '{path}' ignorada: {e}")
+        return True
+    except Exception as e:
+        logging.exception(f"Falha ao salvar o dataset Parquet particionado '{path}': {e}")
+        return False
+    finally:
+        if dataset is not None:
+            dataset.descartar()
+
 def salvar_db_atomic(path, df_chunks, table_name):
     tmp_file = None
     conn_src = None
@@ -115,7 +268,7 @@ def salvar_db_atomic(path, df_chunks, table_name):
         with tempfile.NamedTemporaryFile(delete=False, suffix=".db", prefix="sync_") as tmp:
             tmp_file = tmp.name
 
-        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _garantir_diretorio(path)
         
         if os.path.exists(path) and os.path.getsize(path) > 0:
             conn_src = sqlite3.connect(path)
@@ -129,7 +282,7 @@ def salvar_db_atomic(path, df_chunks, table_name):
         
         header = True
         
-        for df_chunk in df_chunks:
+        for df_chunk in map(_para_dataframe, df_chunks):
             action = 'replace' if header else 'append'
             
             df_chunk.to_sql(table_name_to_use, conn, if_exists=action, index=False)
@@ -145,6 +298,9 @@ def salvar_db_atomic(path, df_chunks, table_name):
         logging.info(f"Arquivo salvo: {path} (Tabela: '{table_name_to_use}', total de linhas={total_rows})")
         return True
 
+    except EscritaDescartada as e:
+        logging.info(f"Escrita de '{path}' ignorada: {e}")
+        return True
     except (SqliteError, pd.io.sql.DatabaseError) as e:
         logging.exception(f"Falha ao salvar o arquivo DB '{path}' (Tabela: '{table_name_to_use}'): {e}")
         return False
@@ -164,15 +320,309 @@ def salvar_db_atomic(path, df_chunks, table_name):
             except OSError:
                 pass
 
-def salvar_atomicamente(path, df_chunks, formato, target_name='data'):
+def _salvar_db_troca_tabela(path, df_chunks, table_name, opcoes):
+    conn = None
+    staging = f"_staging_{table_name}"
+    total_rows = 0
+
+    try:
+        conn = sqlite3.connect(path, isolation_level=None)
+        pragmas = pragmas_bulk(opcoes.get('pragmas'))
+        # O arquivo publicado nunca fica sem journal nem sem fsync.
+        pragmas.pop('journal_mode', None)
+        pragmas['synchronous'] = 'NORMAL'
+        aplicar_pragmas(conn, pragmas)
+
+        conn.execute("BEGIN")
+        total_rows, schema = carregar_chunks(conn, staging, df_chunks)
+        conn.execute("COMMIT")
+
+        conn.execute("PRAGMA synchronous = FULL")
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+        conn.execute(f'ALTER TABLE "{staging}" RENAME TO "{table_name}"')
+        criar_indices(conn, table_name, opcoes.get('indices'))
+        conn.execute("COMMIT")
+
+        logging.info(f"Arquivo salvo: {path} (Tabela: '{table_name}' trocada via staging, total de linhas={total_rows})")
+        return True
+    except EscritaDescartada as e:
+        logging.info(f"Escrita de '{path}' ignorada: {e}")
+        return True
+    except SqliteError as e:
+        logging.exception(f"Falha ao trocar a tabela '{table_name}' no arquivo DB '{path}': {e}")
+        return False
+    except Exception as e:
+        logging.exception(f"Falha genérica ao salvar o arquivo DB '{path}': {e}")
+        return False
+    finally:
+        if conn:
+            try:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                conn.execute(f'DROP TABLE IF EXISTS "{staging}"')
+            except SqliteError:
+                pass
+            conn.close()
+
+def salvar_db_bulk_atomic(path, df_chunks, table_name, opcoes=None):
+    opcoes = opcoes or {}
+    table_name_to_use = table_name or 'data'
+    arquivo_existe = os.path.exists(path) and os.path.getsize(path) > 0
+
+    if opcoes.get('troca_tabela') and arquivo_existe:
+        return _salvar_db_troca_tabela(path, df_chunks, table_name_to_use, opcoes)
+
+    tmp_file = None
+    conn = None
+    total_rows = 0
+
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".db", prefix="sync_") as tmp:
+            tmp_file = tmp.name
+
+        _garantir_diretorio(path)
+
+        if arquivo_existe:
+            conn_src = sqlite3.connect(path)
+            conn_dst = sqlite3.connect(tmp_file)
+            try:
+                conn_src.backup(conn_dst)
+            finally:
+                conn_src.close()
+                conn_dst.close()
+
+        conn = sqlite3.connect(tmp_file, isolation_level=None)
+        if not arquivo_existe:
+            conn.execute(f"PRAGMA page_size = {int(opcoes.get('page_size', SQLITE_BULK_PAGE_SIZE))}")
+        aplicar_pragmas(conn, pragmas_bulk(opcoes.get('pragmas')))
+
+        conn.execute("BEGIN")
+        total_rows, _ = carregar_chunks(conn, table_name_to_use, df_chunks)
+        criar_indices(conn, table_name_to_use, opcoes.get('indices'))
+        conn.execute("COMMIT")
+        conn.close()
+        conn = None
+
+        os.replace(tmp_file, path)
+        logging.info(f"Arquivo salvo: {path} (Tabela: '{table_name_to_use}', carga em lote, total de linhas={total_rows})")
+        return True
+    except EscritaDescartada as e:
+        logging.info(f"Escrita de '{path}' ignorada: {e}")
+        return True
+    except SqliteError as e:
+        logging.exception(f"Falha ao salvar o arquivo DB '{path}' (Tabela: '{table_name_to_use}'): {e}")
+        return False
+    except Exception as e:
+        logging.exception(f"Falha genérica ao salvar o arquivo DB '{path}': {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+        if tmp_file and os.path.exists(tmp_file):
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+
+def salvar_atomicamente(path, df_chunks, formato, target_name='data', opcoes=None):
+    opcoes = opcoes or {}
     if formato == 'xlsx':
         return salvar_xlsx_atomic(path, df_chunks, target_name)
     elif formato == 'csv':
-        return salvar_csv_atomic(path, df_chunks)
+        return salvar_csv_atomic(path, df_chunks, opcoes)
     elif formato == 'parquet':
-        return salvar_parquet_atomic(path, df_chunks)
+        return salvar_parquet_atomic(path, df_chunks, opcoes)
     elif formato == 'db':
+        if opcoes.get('modo') == 'bulk':
+            return salvar_db_bulk_atomic(path, df_chunks, target_name, opcoes)
         return salvar_db_atomic(path, df_chunks, target_name)
     else:
         logging.error(f"Formato de arquivo '{formato}' não suportado.")
-        return False
\ No newline at end of file
+        return False
+
+def _remover_arquivos(*paths):
+    for p in paths:
+        if p and os.path.exists(p):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+def mesclar_parquet_atomic(path, df_chunks, chaves=None, opcoes=None):
+    if particionado(opcoes):
+        return salvar_parquet_particionado_atomic(path, df_chunks, opcoes, chaves, mesclar=True)
+    if not os.path.exists(path):
+        return salvar_parquet_atomic(path, df_chunks, opcoes)
+
+    tmp_delta = None
+    tmp_file = None
+    escritor = None
+    total_rows = 0
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".parquet", prefix="sync_delta_") as tmp:
+            tmp_delta = tmp.name
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".parquet", prefix="sync_") as tmp:
+            tmp_file = tmp.name
+
+        existente = pq.ParquetFile(path)
+        schema = existente.schema_arrow
+
+        presentes = set()
+        escritor = EscritorParquet(tmp_delta, schema)
+        for df_chunk in df_chunks:
+            tabela, _ = tabela_arrow(df_chunk, schema)
+            escritor.escrever(tabela)
+            if chaves:
+                presentes |= chaves_presentes(tabela.select(chaves).to_pandas(), chaves)
+            total_rows += len(df_chunk)
+        escritor.fechar()
+
+        escritor = EscritorParquet(tmp_file, schema, opcoes)
+        mantidas = 0
+        for batch in existente.iter_batches():
+            tabela = pa.Table.from_batches([batch], schema=schema)
+            if chaves:
+                tabela = filtrar_por_chaves(tabela, chaves, presentes)
+            escritor.escrever(tabela)
+            mantidas += tabela.num_rows
+        for batch in pq.ParquetFile(tmp_delta).iter_batches():
+            escritor.escrever(pa.Table.from_batches([batch], schema=schema))
+        escritor.fechar()
+        escritor = None
+
+        os.replace(tmp_file, path)
+        logging.info(f"Arquivo mesclado: {path} (linhas novas/alteradas={total_rows}, linhas mantidas={mantidas})")
+        return True
+    except Exception as e:
+        logging.exception(f"Falha ao mesclar o arquivo Parquet '{path}': {e}")
+        return False
+    finally:
+        if escritor is not None:
+            escritor.abortar()
+        _remover_arquivos(tmp_delta, tmp_file)
+
+def mesclar_csv_atomic(path, df_chunks, chaves=None, opcoes=None):
+    if compressao_csv(opcoes) != "none":
+        logging.error(f"Mesclagem incremental de '{path}' não suporta CSV comprimido (csv_options.compressao).")
+        return False
+    if not os.path.exists(path):
+        return salvar_csv_atomic(path, df_chunks, opcoes)
+
+    tmp_delta = None
+    tmp_file = None
+    total_rows = 0
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv", prefix="sync_delta_") as tmp:
+            tmp_delta = tmp.name
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv", prefix="sync_") as tmp:
+            tmp_file = tmp.name
+
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            cabecalho = f.readline()
+        colunas_existentes = next(csv.reader([cabecalho]))
+
+        with open(tmp_delta, 'w', encoding='utf-8', newline='') as out:
+            for df_chunk in map(_para_dataframe, df_chunks):
+                if list(map(str, df_chunk.columns)) != colunas_existentes:
+                    raise RuntimeError(f"Colunas do delta diferem das colunas de '{path}'.")
+                df_chunk.to_csv(out, index=False, header=False, lineterminator='\n')
+                total_rows += len(df_chunk)
+
+        presentes = set()
+        if chaves:
+            for parte in pd.read_csv(tmp_delta, names=colunas_existentes, usecols=chaves, dtype=str, keep_default_na=False, chunksize=100000):
+                presentes |= chaves_presentes(parte, chaves)
+
+        mantidas = 0
+        with open(tmp_file, 'w', encoding='utf-8', newline='') as out:
+            out.write(cabecalho)
+            if chaves:
+                for parte in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=100000):
+                    if len(chaves) == 1:
+                        mascara = parte[chaves[0]].isin(presentes)
+                    else:
+                        mascara = pd.MultiIndex.from_frame(parte[chaves]).isin(presentes)
+                    parte = parte[~np.asarray(mascara, dtype=bool)]
+                    parte.to_csv(out, index=False, header=False, lineterminator='\n')
+                    mantidas += len(parte)
+            else:
+                with open(path, 'r', encoding='utf-8', newline='') as f:
+                    f.readline()
+                    for linha in f:
+                        out.write(linha)
+                        mantidas += 1
+            with open(tmp_delta, 'r', encoding='utf-8', newline='') as f:
+                shutil.copyfileobj(f, out)
+
+        os.replace(tmp_file, path)
+        logging.info(f"Arquivo mesclado: {path} (linhas novas/alteradas={total_rows}, linhas mantidas={mantidas})")
+        return True
+    except Exception as e:
+        logging.exception(f"Falha ao mesclar o arquivo CSV '{path}': {e}")
+        return False
+    finally:
+        _remover_arquivos(tmp_delta, tmp_file)
+
+def mesclar_db_atomic(path, df_chunks, table_name, chaves=None):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return salvar_db_atomic(path, df_chunks, table_name)
+
+    conn = None
+    total_rows = 0
+    table_name_to_use = table_name or 'data'
+    staging = f"_delta_{table_name_to_use}"
+
+    try:
+        conn = sqlite3.connect(path)
+        existe = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table_name_to_use,)
+        ).fetchone()
+
+        total_rows, schema = carregar_chunks(conn, staging, df_chunks)
+        conn.commit()
+
+        if schema is None:
+            return True
+        colunas = schema.names
+
+        lista_colunas = ", ".join(f'"{c}"' for c in colunas)
+        with conn:
+            if not existe:
+                conn.execute(f'ALTER TABLE "{staging}" RENAME TO "{table_name_to_use}"')
+            else:
+                if chaves:
+                    lista_chaves = ", ".join(f'"{c}"' for c in chaves)
+                    conn.execute(
+                        f'DELETE FROM "{table_name_to_use}" WHERE ({lista_chaves}) IN (SELECT {lista_chaves} FROM "{staging}")'
+                    )
+                conn.execute(f'INSERT INTO "{table_name_to_use}" ({lista_colunas}) SELECT {lista_colunas} FROM "{staging}"')
+                conn.execute(f'DROP TABLE "{staging}"')
+
+        logging.info(f"Arquivo mesclado: {path} (Tabela: '{table_name_to_use}', linhas novas/alteradas={total_rows})")
+        return True
+    except (SqliteError, pd.io.sql.DatabaseError) as e:
+        logging.exception(f"Falha ao mesclar o arquivo DB '{path}' (Tabela: '{table_name_to_use}'): {e}")
+        return False
+    except Exception as e:
+        logging.exception(f"Falha genérica ao mesclar o arquivo DB '{path}': {e}")
+        return False
+    finally:
+        if conn:
+            try:
+                conn.execute(f'DROP TABLE IF EXISTS "{staging}"')
+                conn.commit()
+            except SqliteError:
+                pass
+            conn.close()
+
+def mesclar_atomicamente(path, df_chunks, formato, target_name='data', chaves=None, opcoes=None):
+    if formato == 'csv':
+        return mesclar_csv_atomic(path, df_chunks, chaves, opcoes)
+    elif formato == 'parquet':
+        return mesclar_parquet_atomic(path, df_chunks, chaves, opcoes)
+    elif formato == 'db':
+        return mesclar_db_atomic(path, df_chunks, target_name, chaves)
+    else:
+        logging.error(f"Formato de arquivo '{formato}' não suporta mesclagem incremental.")
+        return False
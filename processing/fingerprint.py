@@ -0,0 +1,85 @@
+import hashlib
+import logging
+import os
+import pandas as pd
+import pyarrow as pa
+from openpyxl import load_workbook
+from config.settings import identificador_tarefa
+from processing.file_writer import EscritaDescartada
+from sap.connection import executar_consulta
+from utils.estado import carregar_estado, salvar_estado
+
+NAMESPACE_FINGERPRINTS = "fingerprints"
+
+def _bytes_chunk(chunk):
+    if isinstance(chunk, (pa.Table, pa.RecordBatch)):
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, chunk.schema) as writer:
+            writer.write(chunk)
+        return sink.getvalue().to_pybytes()
+
+    cabecalho = "|".join(f"{c}:{t}" for c, t in zip(chunk.columns, chunk.dtypes)).encode('utf-8')
+    return cabecalho + pd.util.hash_pandas_object(chunk, index=False).values.tobytes()
+
+
+def _saida_existe(filename, tarefa):
+    if not os.path.exists(filename):
+        return False
+    if tarefa.get("formato_saida", "xlsx") != "xlsx":
+        return True
+    # Num workbook compartilhado, o arquivo existir não garante que a planilha da tarefa exista.
+    wb = load_workbook(filename, read_only=True)
+    try:
+        return tarefa["tabela"] in wb.sheetnames
+    finally:
+        wb.close()
+
+
+class DeteccaoAlteracoes:
+    def __init__(self, tarefa, filename):
+        self.tabela = tarefa["tabela"]
+        self.id_tarefa = identificador_tarefa(tarefa)
+        self.consulta_verificacao = tarefa.get("consulta_verificacao")
+        self.hash_conteudo = tarefa.get("detectar_alteracoes", False)
+        self.estado = carregar_estado(NAMESPACE_FINGERPRINTS, self.id_tarefa)
+        self.saida_existe = _saida_existe(filename, tarefa)
+        self.novo_estado = dict(self.estado)
+        # Motivo da execução evitada ("sonda" ou "conteudo"), exportado nas métricas da tarefa.
+        self.evitada = None
+
+    def sonda_inalterada(self, conn):
+        if not self.consulta_verificacao:
+            return False
+
+        cols, rows = executar_consulta(conn, self.consulta_verificacao)
+        digest = hashlib.sha1(repr((cols, rows)).encode('utf-8')).hexdigest()
+        self.novo_estado["sonda"] = digest
+
+        if self.saida_existe and self.estado.get("sonda") == digest:
+            self.evitada = "sonda"
+            logging.info(f"Tarefa '{self.tabela}': consulta de verificação sem alterações. Extração ignorada.")
+            return True
+        return False
+
+    def envolver(self, chunks):
+        if not self.hash_conteudo:
+            yield from chunks
+            return
+
+        h = hashlib.blake2b(digest_size=20)
+        linhas = 0
+        for chunk in chunks:
+            h.update(_bytes_chunk(chunk))
+            linhas += len(chunk)
+            yield chunk
+
+        digest = h.hexdigest()
+        self.novo_estado["hash"] = digest
+        if self.saida_existe and self.estado.get("hash") == digest:
+            self.evitada = "conteudo"
+            raise EscritaDescartada(f"conteúdo inalterado desde a última execução ({linhas} linhas)")
+
+    def registrar_sucesso(self):
+        if self.novo_estado != self.estado:
+            salvar_estado(NAMESPACE_FINGERPRINTS, self.id_tarefa, self.novo_estado)
+            self.estado = dict(self.novo_estado)
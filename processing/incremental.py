@@ -0,0 +1,126 @@
+import datetime
+import decimal
+import hashlib
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from config.settings import identificador_tarefa
+from utils.estado import carregar_estado, salvar_estado
+
+NAMESPACE_WATERMARKS = "watermarks"
+FORMATOS_INCREMENTAIS = ("db", "parquet", "csv")
+
+
+def _serializar_valor(valor):
+    if isinstance(valor, pd.Timestamp):
+        valor = valor.to_pydatetime()
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+
+    if isinstance(valor, datetime.datetime):
+        return {"tipo": "datetime", "valor": valor.isoformat()}
+    if isinstance(valor, datetime.date):
+        return {"tipo": "date", "valor": valor.isoformat()}
+    if isinstance(valor, decimal.Decimal):
+        return {"tipo": "decimal", "valor": str(valor)}
+    if isinstance(valor, bool):
+        return {"tipo": "int", "valor": int(valor)}
+    if isinstance(valor, int):
+        return {"tipo": "int", "valor": valor}
+    if isinstance(valor, float):
+        return {"tipo": "float", "valor": valor}
+    return {"tipo": "str", "valor": str(valor)}
+
+
+def _desserializar_valor(dados):
+    tipo = dados.get("tipo")
+    valor = dados.get("valor")
+    if tipo == "datetime":
+        return datetime.datetime.fromisoformat(valor)
+    if tipo == "date":
+        return datetime.date.fromisoformat(valor)
+    if tipo == "decimal":
+        return decimal.Decimal(valor)
+    if tipo == "int":
+        return int(valor)
+    if tipo == "float":
+        return float(valor)
+    return valor
+
+
+class ExtracaoIncremental:
+    def __init__(self, tarefa, filename):
+        config = tarefa["incremental"]
+        if not config.get("coluna"):
+            raise ValueError(f"Configuração 'incremental' da tarefa '{tarefa['tabela']}' sem a chave 'coluna'.")
+
+        self.coluna = config["coluna"]
+        chaves = config.get("chave") or []
+        self.chaves = [chaves] if isinstance(chaves, str) else list(chaves)
+        self.refresh_completo_horas = config.get("refresh_completo_horas")
+
+        self.id_tarefa = identificador_tarefa(tarefa)
+        self.hash_consulta = hashlib.sha1(f"{tarefa['consulta_sap']}|{self.coluna}".encode('utf-8')).hexdigest()
+        self.estado = carregar_estado(NAMESPACE_WATERMARKS, self.id_tarefa)
+        self.maximo = None
+
+        motivo = self._motivo_refresh_completo(tarefa.get("formato_saida", "xlsx"), filename)
+        self.completo = motivo is not None
+        if self.completo:
+            logging.info(f"Tarefa '{tarefa['tabela']}': extração completa ({motivo}).")
+        else:
+            logging.info(f"Tarefa '{tarefa['tabela']}': extração incremental a partir de {self.coluna} = {self.estado['watermark']['valor']}.")
+
+    def _motivo_refresh_completo(self, formato, filename):
+        if formato not in FORMATOS_INCREMENTAIS:
+            return f"formato '{formato}' não suporta mesclagem incremental"
+        if not self.estado.get("watermark"):
+            return "sem watermark registrado"
+        if self.estado.get("consulta_hash") != self.hash_consulta:
+            return "consulta ou coluna de watermark alterada"
+        if not os.path.exists(filename):
+            return "arquivo de saída inexistente"
+        if self.refresh_completo_horas:
+            ultimo = self.estado.get("ultimo_completo", 0)
+            if time.time() - ultimo >= float(self.refresh_completo_horas) * 3600:
+                return f"refresh completo a cada {self.refresh_completo_horas}h"
+        return None
+
+    def consulta(self, consulta):
+        if self.completo:
+            return consulta, None
+
+        operador = ">=" if self.chaves else ">"
+        consulta_base = consulta.strip().rstrip(";")
+        consulta_delta = f'SELECT * FROM ({consulta_base}) AS delta WHERE "{self.coluna}" {operador} ?'
+        return consulta_delta, [_desserializar_valor(self.estado["watermark"])]
+
+    def observar(self, chunk):
+        arrow = isinstance(chunk, (pa.Table, pa.RecordBatch))
+        colunas = chunk.schema.names if arrow else chunk.columns
+        if self.coluna not in colunas:
+            raise RuntimeError(f"Coluna de watermark '{self.coluna}' não retornada pela consulta.")
+
+        if arrow:
+            maximo_chunk = pc.max(chunk.column(self.coluna)).as_py()
+        else:
+            maximo_chunk = chunk[self.coluna].max()
+        if maximo_chunk is None or pd.isna(maximo_chunk):
+            return
+        if self.maximo is None or maximo_chunk > self.maximo:
+            self.maximo = maximo_chunk
+
+    def registrar_sucesso(self):
+        novo_estado = dict(self.estado)
+        if self.maximo is not None:
+            novo_estado["watermark"] = _serializar_valor(self.maximo)
+        if self.completo:
+            novo_estado["ultimo_completo"] = time.time()
+            novo_estado["consulta_hash"] = self.hash_consulta
+        if novo_estado != self.estado:
+            salvar_estado(NAMESPACE_WATERMARKS, self.id_tarefa, novo_estado)
+            self.estado = novo_estado
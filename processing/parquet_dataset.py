@@ -0,0 +1,319 @@
+import decimal
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+PARTICAO_NULA = "__HIVE_DEFAULT_PARTITION__"
+NOME_ARQUIVO_PARTE = "part-{}.parquet"
+NIVEIS_DATA = {
+    "ano": pc.year,
+    "mes": pc.month,
+    "dia": pc.day,
+}
+
+
+def _campo_estavel(campo):
+    # Tipos inferidos só do primeiro chunk: nulo vira string e decimal recebe a precisão máxima.
+    if pa.types.is_null(campo.type):
+        return pa.field(campo.name, pa.string())
+    if pa.types.is_decimal(campo.type):
+        return pa.field(campo.name, pa.decimal128(38, campo.type.scale))
+    return campo
+
+
+def tabela_arrow(df, schema=None):
+    if isinstance(df, (pa.Table, pa.RecordBatch)):
+        tabela = pa.Table.from_batches([df]) if isinstance(df, pa.RecordBatch) else df
+        if schema is None:
+            schema = pa.schema([_campo_estavel(f) for f in tabela.schema], metadata=tabela.schema.metadata)
+        return tabela.select(schema.names).cast(schema), schema
+
+    if schema is None:
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        schema = pa.schema([_campo_estavel(f) for f in tabela.schema], metadata=tabela.schema.metadata)
+        return tabela.cast(schema), schema
+
+    try:
+        return pa.Table.from_pandas(df, schema=schema, preserve_index=False), schema
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        df = df.copy()
+        for campo in schema:
+            if campo.name not in df.columns:
+                continue
+            if pa.types.is_string(campo.type):
+                df[campo.name] = df[campo.name].astype('string')
+            elif pa.types.is_decimal(campo.type):
+                quantum = decimal.Decimal(1).scaleb(-campo.type.scale)
+                df[campo.name] = df[campo.name].map(
+                    lambda v: v.quantize(quantum) if isinstance(v, decimal.Decimal) else v
+                )
+        return pa.Table.from_pandas(df, schema=schema, preserve_index=False), schema
+
+
+def opcoes_escrita(opcoes):
+    opcoes = opcoes or {}
+    kwargs = {
+        "compression": opcoes.get("compressao", "snappy"),
+        "use_dictionary": opcoes.get("dicionario", True),
+        "write_statistics": opcoes.get("estatisticas", True),
+    }
+    if opcoes.get("nivel_compressao") is not None:
+        kwargs["compression_level"] = opcoes["nivel_compressao"]
+    return kwargs
+
+
+class EscritorParquet:
+    def __init__(self, path, schema, opcoes=None):
+        opcoes = opcoes or {}
+        self.path = path
+        self.schema = schema
+        self.tamanho_row_group = opcoes.get("tamanho_row_group")
+        self.linhas = 0
+        self._buffer = []
+        self._linhas_buffer = 0
+        self._writer = pq.ParquetWriter(path, schema, **opcoes_escrita(opcoes))
+
+    def escrever(self, tabela):
+        self.linhas += tabela.num_rows
+        if not self.tamanho_row_group:
+            self._writer.write_table(tabela)
+            return
+
+        self._buffer.append(tabela)
+        self._linhas_buffer += tabela.num_rows
+        if self._linhas_buffer >= self.tamanho_row_group:
+            self._descarregar(final=False)
+
+    def _descarregar(self, final):
+        if not self._buffer:
+            return
+        acumulado = pa.concat_tables(self._buffer)
+        completos = (acumulado.num_rows // self.tamanho_row_group) * self.tamanho_row_group
+        if final:
+            completos = acumulado.num_rows
+        if completos:
+            self._writer.write_table(acumulado.slice(0, completos), row_group_size=self.tamanho_row_group)
+        resto = acumulado.slice(completos)
+        self._buffer = [resto] if resto.num_rows else []
+        self._linhas_buffer = resto.num_rows
+
+    def fechar(self):
+        if self.tamanho_row_group:
+            self._descarregar(final=True)
+        self._writer.close()
+
+    def abortar(self):
+        try:
+            self._writer.close()
+        except Exception:
+            pass
+
+
+def _niveis_particao(opcoes):
+    niveis = []
+    por_data = opcoes.get("particionar_por_data")
+    if por_data:
+        for nivel in por_data.get("niveis", ["ano", "mes"]):
+            if nivel not in NIVEIS_DATA:
+                raise ValueError(f"Nível de partição por data '{nivel}' inválido. Use um de {', '.join(NIVEIS_DATA)}.")
+            niveis.append((nivel, por_data["coluna"], nivel))
+    for coluna in opcoes.get("particionar_por", []):
+        niveis.append((coluna, coluna, None))
+    return niveis
+
+
+def particionado(opcoes):
+    return bool(opcoes and (opcoes.get("particionar_por") or opcoes.get("particionar_por_data")))
+
+
+def _valor_particao(valor):
+    if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+        return PARTICAO_NULA
+    texto = str(valor)
+    for proibido in ("/", "\\", "="):
+        texto = texto.replace(proibido, "_")
+    return texto
+
+
+def dividir_por_particao(tabela, niveis):
+    colunas_particao = {}
+    for nome, coluna, nivel in niveis:
+        arr = tabela.column(coluna)
+        colunas_particao[nome] = NIVEIS_DATA[nivel](arr) if nivel else arr
+
+    chaves = pd.DataFrame({nome: arr.to_pandas(integer_object_nulls=True) for nome, arr in colunas_particao.items()})
+    chaves = chaves.astype(object).where(chaves.notna(), None)
+
+    descartar = [coluna for nome, coluna, nivel in niveis if nivel is None]
+    dados = tabela.drop_columns(descartar) if descartar else tabela
+
+    grupos = chaves.groupby(list(chaves.columns), dropna=False, sort=False).indices
+    for valores, indices in grupos.items():
+        if not isinstance(valores, tuple):
+            valores = (valores,)
+        relativo = os.path.join(*[f"{nome}={_valor_particao(v)}" for (nome, _, _), v in zip(niveis, valores)])
+        yield relativo, dados.take(pa.array(indices))
+
+
+def _arquivos_particao(diretorio):
+    if not os.path.isdir(diretorio):
+        return []
+    return sorted(f for f in os.listdir(diretorio) if f.endswith(".parquet"))
+
+
+def _particoes_existentes(path):
+    particoes = set()
+    for raiz, _, arquivos in os.walk(path):
+        if any(a.endswith(".parquet") for a in arquivos):
+            particoes.add(os.path.relpath(raiz, path))
+    return particoes
+
+
+class DatasetParticionado:
+    def __init__(self, path, opcoes):
+        self.path = path
+        self.opcoes = opcoes
+        self.niveis = _niveis_particao(opcoes)
+        self.max_escritores = int(opcoes.get("max_escritores_abertos", 64))
+        base = os.path.dirname(os.path.abspath(path))
+        os.makedirs(base, exist_ok=True)
+        self.staging = tempfile.mkdtemp(prefix=".sync_dataset_", dir=base)
+        self.schema = None
+        self._escritores = {}
+        self._partes = {}
+        self.linhas = 0
+
+    def _abrir(self, relativo, schema):
+        if len(self._escritores) >= self.max_escritores:
+            antigo = next(iter(self._escritores))
+            self._escritores.pop(antigo).fechar()
+        indice = self._partes.get(relativo, -1) + 1
+        self._partes[relativo] = indice
+        diretorio = os.path.join(self.staging, relativo)
+        os.makedirs(diretorio, exist_ok=True)
+        escritor = EscritorParquet(os.path.join(diretorio, NOME_ARQUIVO_PARTE.format(indice)), schema, self.opcoes)
+        self._escritores[relativo] = escritor
+        return escritor
+
+    def escrever(self, chunk):
+        tabela, self.schema = tabela_arrow(chunk, self.schema)
+        for relativo, parte in dividir_por_particao(tabela, self.niveis):
+            escritor = self._escritores.get(relativo) or self._abrir(relativo, parte.schema)
+            escritor.escrever(parte)
+        self.linhas += tabela.num_rows
+
+    def fechar_escritores(self):
+        for escritor in self._escritores.values():
+            escritor.fechar()
+        self._escritores = {}
+
+    def particoes_staging(self):
+        return set(self._partes)
+
+    def _trocar_particao(self, relativo):
+        # A partição inteira é trocada por renomeação de diretório: quem lê o dataset vê só as partes
+        # antigas ou só as novas, nunca uma mistura das duas.
+        origem = os.path.join(self.staging, relativo)
+        destino = os.path.join(self.path, relativo)
+        if not os.path.isdir(destino):
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.rename(origem, destino)
+            return
+
+        # Subpartições (de um particionamento anterior mais profundo) continuam no diretório novo.
+        for nome in os.listdir(destino):
+            if os.path.isdir(os.path.join(destino, nome)) and not os.path.exists(os.path.join(origem, nome)):
+                os.rename(os.path.join(destino, nome), os.path.join(origem, nome))
+        antigo = os.path.join(self.staging, ".substituidas", relativo)
+        os.makedirs(os.path.dirname(antigo), exist_ok=True)
+        os.rename(destino, antigo)
+        os.rename(origem, destino)
+        shutil.rmtree(antigo, ignore_errors=True)
+
+    def publicar(self, particoes, remover_ausentes):
+        if os.path.isfile(self.path):
+            logging.warning(f"'{self.path}' é um arquivo Parquet único e será convertido em dataset particionado.")
+            os.remove(self.path)
+        os.makedirs(self.path, exist_ok=True)
+
+        for relativo in sorted(particoes):
+            self._trocar_particao(relativo)
+
+        removidas = 0
+        if remover_ausentes:
+            for relativo in _particoes_existentes(self.path) - set(particoes):
+                diretorio = os.path.join(self.path, relativo)
+                for arquivo in _arquivos_particao(diretorio):
+                    os.remove(os.path.join(diretorio, arquivo))
+                removidas += 1
+            for raiz, _, _ in sorted(os.walk(self.path), key=lambda w: -len(w[0])):
+                if raiz != self.path and not os.listdir(raiz):
+                    os.rmdir(raiz)
+        return removidas
+
+    def descartar(self):
+        for escritor in self._escritores.values():
+            escritor.abortar()
+        self._escritores = {}
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+def filtrar_por_chaves(tabela, chaves, presentes):
+    df_chaves = tabela.select(chaves).to_pandas()
+    if len(chaves) == 1:
+        mascara = df_chaves[chaves[0]].isin(presentes)
+    else:
+        mascara = pd.MultiIndex.from_frame(df_chaves).isin(presentes)
+    return tabela.filter(pa.array(~np.asarray(mascara, dtype=bool)))
+
+
+def chaves_presentes(df, chaves):
+    if len(chaves) == 1:
+        return set(df[chaves[0]].tolist())
+    return set(df[chaves].itertuples(index=False, name=None))
+
+
+def mesclar_particoes(dataset, chaves):
+    mantidas = 0
+    for relativo in sorted(dataset.particoes_staging()):
+        origem = os.path.join(dataset.staging, relativo)
+        destino = os.path.join(dataset.path, relativo)
+        arquivos_delta = [os.path.join(origem, a) for a in _arquivos_particao(origem)]
+        arquivos_existentes = [os.path.join(destino, a) for a in _arquivos_particao(destino)]
+        if not arquivos_existentes:
+            continue
+
+        schema = pq.read_schema(arquivos_existentes[0])
+        presentes = set()
+        if chaves:
+            for arquivo in arquivos_delta:
+                presentes |= chaves_presentes(pq.read_table(arquivo, columns=chaves).to_pandas(), chaves)
+
+        mesclado = os.path.join(origem, "merged.tmp")
+        escritor = EscritorParquet(mesclado, schema, dataset.opcoes)
+        try:
+            for arquivo in arquivos_existentes:
+                for batch in pq.ParquetFile(arquivo).iter_batches():
+                    tabela = pa.Table.from_batches([batch]).cast(schema)
+                    if chaves:
+                        tabela = filtrar_por_chaves(tabela, chaves, presentes)
+                    escritor.escrever(tabela)
+                    mantidas += tabela.num_rows
+            for arquivo in arquivos_delta:
+                for batch in pq.ParquetFile(arquivo).iter_batches():
+                    escritor.escrever(pa.Table.from_batches([batch]).select(schema.names).cast(schema))
+            escritor.fechar()
+        except Exception:
+            escritor.abortar()
+            raise
+
+        for arquivo in arquivos_delta:
+            os.remove(arquivo)
+        os.replace(mesclado, os.path.join(origem, NOME_ARQUIVO_PARTE.format(0)))
+    return mantidas
@@ -0,0 +1,146 @@
+import logging
+import queue
+import threading
+
+_FIM = object()
+
+
+class _FalhaEstagio:
+    def __init__(self, estagio, erro):
+        self.estagio = estagio
+        self.erro = erro
+
+
+def _colocar(fila, item, cancelado):
+    while not cancelado.is_set():
+        try:
+            fila.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _obter(fila, cancelado):
+    while not cancelado.is_set():
+        try:
+            return fila.get(timeout=0.2)
+        except queue.Empty:
+            continue
+    return _FIM
+
+
+def _estagio_busca(fonte, saida, cancelado):
+    try:
+        for lote in fonte:
+            if not _colocar(saida, lote, cancelado):
+                break
+        else:
+            _colocar(saida, _FIM, cancelado)
+    except Exception as e:
+        _colocar(saida, _FalhaEstagio("busca", e), cancelado)
+    finally:
+        close = getattr(fonte, "close", None)
+        if close:
+            close()
+
+
+def _estagio_transformacao(transformar, entrada, saida, cancelado):
+    while True:
+        lote = _obter(entrada, cancelado)
+        if lote is _FIM or isinstance(lote, _FalhaEstagio):
+            _colocar(saida, lote, cancelado)
+            return
+        try:
+            resultado = transformar(lote)
+        except Exception as e:
+            _colocar(saida, _FalhaEstagio("transformação", e), cancelado)
+            return
+        if not _colocar(saida, resultado, cancelado):
+            return
+
+
+def executar_em_pipeline(fonte, transformar, profundidade_fila=4, nome="pipeline"):
+    cancelado = threading.Event()
+    fila_busca = queue.Queue(maxsize=max(1, profundidade_fila))
+    fila_transformacao = queue.Queue(maxsize=max(1, profundidade_fila))
+
+    threads = [
+        threading.Thread(target=_estagio_busca, args=(fonte, fila_busca, cancelado), name=f"{nome}-busca", daemon=True),
+        threading.Thread(target=_estagio_transformacao, args=(transformar, fila_busca, fila_transformacao, cancelado), name=f"{nome}-transformacao", daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    try:
+        while True:
+            item = fila_transformacao.get()
+            if item is _FIM:
+                return
+            if isinstance(item, _FalhaEstagio):
+                logging.error(f"Falha no estágio de {item.estagio} do pipeline '{nome}'. Cancelando os demais estágios.")
+                raise item.erro
+            yield item
+    finally:
+        cancelado.set()
+        for t in threads:
+            t.join(timeout=30)
+            if t.is_alive():
+                logging.warning(f"Thread '{t.name}' não encerrou após o cancelamento do pipeline.")
+
+
+def _estagio_fontes(pendentes, saida, cancelado):
+    try:
+        while not cancelado.is_set():
+            try:
+                abrir = pendentes.get_nowait()
+            except queue.Empty:
+                break
+            fonte = abrir()
+            try:
+                for lote in fonte:
+                    if not _colocar(saida, lote, cancelado):
+                        return
+            finally:
+                close = getattr(fonte, "close", None)
+                if close:
+                    close()
+    except Exception as e:
+        _colocar(saida, _FalhaEstagio("busca", e), cancelado)
+        return
+    _colocar(saida, _FIM, cancelado)
+
+
+def intercalar_fontes(fontes, paralelismo, profundidade_fila=4, nome="fontes"):
+    # Cada fonte é uma função que abre um iterador de lotes; até `paralelismo` threads consomem as fontes
+    # e os lotes saem numa única fila limitada, na ordem em que ficam prontos.
+    cancelado = threading.Event()
+    pendentes = queue.Queue()
+    for abrir in fontes:
+        pendentes.put(abrir)
+    saida = queue.Queue(maxsize=max(1, profundidade_fila))
+
+    threads = [
+        threading.Thread(target=_estagio_fontes, args=(pendentes, saida, cancelado), name=f"{nome}-busca-{i}", daemon=True)
+        for i in range(1, max(1, min(paralelismo, len(fontes))) + 1)
+    ]
+    for t in threads:
+        t.start()
+
+    try:
+        ativas = len(threads)
+        while ativas:
+            item = saida.get()
+            if item is _FIM:
+                ativas -= 1
+                continue
+            if isinstance(item, _FalhaEstagio):
+                logging.error(f"Falha numa das buscas paralelas de '{nome}'. Cancelando as demais.")
+                raise item.erro
+            yield item
+    finally:
+        cancelado.set()
+        for t in threads:
+            t.join(timeout=30)
+            if t.is_alive():
+                logging.warning(f"Thread '{t.name}' não encerrou após o cancelamento das buscas paralelas.")
@@ -0,0 +1,146 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from config.settings import ESTADO_DIR, identificador_tarefa
+from processing.parquet_dataset import tabela_arrow
+from utils.estado import carregar_estado, salvar_estado, remover_estado
+
+NAMESPACE_RETOMADA = "retomada"
+
+
+class ExtracaoRetomavel:
+    # Extração ordenada por uma chave (keyset) com checkpoints: os lotes já lidos ficam em partes parquet
+    # num diretório de staging e, após uma falha, a próxima tentativa relê essas partes e continua no HANA
+    # a partir da última chave gravada.
+    def __init__(self, tarefa, consulta, parametros=None):
+        config = tarefa["retomada"]
+        if not config.get("chave"):
+            raise ValueError(f"Configuração 'retomada' da tarefa '{tarefa['tabela']}' sem a chave 'chave'.")
+
+        self.nome = tarefa["tabela"]
+        self.chave = config["chave"]
+        self.linhas_por_checkpoint = int(config.get("linhas_por_checkpoint", 500000))
+        self.validade_horas = float(config.get("validade_horas", 24))
+        self.consulta = consulta
+        self.parametros = list(parametros or [])
+
+        self.id_tarefa = identificador_tarefa(tarefa)
+        self.hash_consulta = hashlib.sha1(
+            json.dumps([consulta, self.parametros, self.chave], ensure_ascii=False, default=str).encode('utf-8')
+        ).hexdigest()
+        self.diretorio = os.path.join(ESTADO_DIR, NAMESPACE_RETOMADA, hashlib.sha1(self.id_tarefa.encode('utf-8')).hexdigest())
+        self.estado = carregar_estado(NAMESPACE_RETOMADA, self.id_tarefa)
+        self.schema = None
+        self.checkpoints_ativos = True
+
+        motivo = self._motivo_descarte()
+        if motivo:
+            if os.path.isdir(self.diretorio):
+                logging.info(f"Tarefa '{self.nome}': checkpoints anteriores descartados ({motivo}).")
+            self._limpar()
+        self.partes = sorted(glob.glob(os.path.join(self.diretorio, "parte-*.parquet")))
+
+    def _motivo_descarte(self):
+        if not self.estado:
+            return "sem checkpoint registrado"
+        if self.estado.get("consulta_hash") != self.hash_consulta:
+            return "consulta ou chave de retomada alterada"
+        if time.time() - self.estado.get("iniciado_em", 0) >= self.validade_horas * 3600:
+            return f"checkpoints com mais de {self.validade_horas:g}h"
+        return None
+
+    def _limpar(self):
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+        remover_estado(NAMESPACE_RETOMADA, self.id_tarefa)
+        self.estado = {}
+
+    def _ultima_chave(self):
+        if not self.partes:
+            return None
+        coluna = pq.read_table(self.partes[-1], columns=[self.chave]).column(self.chave)
+        return pc.max(coluna).as_py()
+
+    def consulta_restante(self):
+        coluna = f'"{self.chave}"'
+        base = self.consulta.strip().rstrip(";")
+        ultima = self._ultima_chave()
+        if ultima is None:
+            return f"SELECT * FROM ({base}) AS retomada ORDER BY {coluna}", list(self.parametros)
+        return f"SELECT * FROM ({base}) AS retomada WHERE {coluna} > ? ORDER BY {coluna}", self.parametros + [ultima]
+
+    def _gravar_parte(self, batches, final):
+        try:
+            tabelas = []
+            for batch in batches:
+                tabela, self.schema = tabela_arrow(batch, self.schema)
+                tabelas.append(tabela)
+            tabela = pa.concat_tables(tabelas)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            logging.warning(f"Tarefa '{self.nome}': checkpoints desativados nesta execução (lotes com tipos incompatíveis: {e}).")
+            self.checkpoints_ativos = False
+            return []
+
+        resto = tabela.slice(0, 0)
+        if not final:
+            # Linhas com a mesma chave da última linha podem continuar no próximo lote: ficam para o próximo checkpoint.
+            chaves = tabela.column(self.chave)
+            completas = pc.sum(pc.less(chaves, chaves[-1])).as_py() or 0
+            tabela, resto = tabela.slice(0, completas), tabela.slice(completas)
+        if tabela.num_rows:
+            os.makedirs(self.diretorio, exist_ok=True)
+            if not self.estado:
+                self.estado = {"consulta_hash": self.hash_consulta, "iniciado_em": time.time(), "linhas": 0}
+            with tempfile.NamedTemporaryFile(delete=False, dir=self.diretorio, suffix=".tmp") as tmp:
+                tmp_file = tmp.name
+            try:
+                pq.write_table(tabela, tmp_file)
+                path = os.path.join(self.diretorio, f"parte-{len(self.partes):05d}.parquet")
+                os.replace(tmp_file, path)
+            finally:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+            self.partes.append(path)
+            self.estado = dict(self.estado, linhas=self.estado["linhas"] + tabela.num_rows, partes=len(self.partes))
+            salvar_estado(NAMESPACE_RETOMADA, self.id_tarefa, self.estado)
+        return resto.to_batches()
+
+    def executar(self, buscar):
+        # buscar(sql, parametros) abre o iterador de RecordBatch no HANA.
+        if self.partes:
+            logging.info(
+                f"Tarefa '{self.nome}': retomando a partir de {len(self.partes)} checkpoints "
+                f"({self.estado.get('linhas', 0)} linhas já extraídas)."
+            )
+            for path in self.partes:
+                yield from pq.read_table(path).to_batches()
+
+        sql, parametros = self.consulta_restante()
+        pendentes = []
+        linhas_pendentes = 0
+        for batch in buscar(sql, parametros):
+            if self.chave not in batch.schema.names:
+                raise RuntimeError(f"Coluna de retomada '{self.chave}' não retornada pela consulta.")
+            if batch.column(self.chave).null_count:
+                raise RuntimeError(f"Coluna de retomada '{self.chave}' com valores nulos; ela precisa ser não nula para a extração por chave.")
+            yield batch
+
+            if self.checkpoints_ativos:
+                pendentes.append(batch)
+                linhas_pendentes += batch.num_rows
+                if linhas_pendentes >= self.linhas_por_checkpoint:
+                    pendentes = self._gravar_parte(pendentes, final=False)
+                    linhas_pendentes = sum(b.num_rows for b in pendentes)
+
+        if self.checkpoints_ativos and pendentes:
+            self._gravar_parte(pendentes, final=True)
+
+    def registrar_sucesso(self):
+        self._limpar()
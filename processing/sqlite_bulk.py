@@ -0,0 +1,98 @@
+import logging
+import pyarrow as pa
+import pyarrow.compute as pc
+from config.settings import SQLITE_BULK_PRAGMAS
+from processing.dataframe_handler import texto_arrow
+
+
+def _quote(nome):
+    return '"' + str(nome).replace('"', '""') + '"'
+
+
+def _tipo_sqlite_arrow(tipo):
+    if pa.types.is_integer(tipo) or pa.types.is_boolean(tipo):
+        return "INTEGER"
+    if pa.types.is_floating(tipo) or pa.types.is_decimal(tipo):
+        return "REAL"
+    if pa.types.is_binary(tipo) or pa.types.is_large_binary(tipo):
+        return "BLOB"
+    if pa.types.is_timestamp(tipo) or pa.types.is_date(tipo):
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+def _tabela_sqlite(chunk):
+    if isinstance(chunk, pa.RecordBatch):
+        return pa.Table.from_batches([chunk])
+    if isinstance(chunk, pa.Table):
+        return chunk
+    try:
+        return pa.Table.from_pandas(chunk, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        arrays = []
+        for col in chunk.columns:
+            try:
+                arrays.append(pa.Array.from_pandas(chunk[col]))
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                arrays.append(pa.Array.from_pandas(chunk[col].astype('string')))
+        return pa.Table.from_arrays(arrays, names=[str(c) for c in chunk.columns])
+
+
+def _coluna_sqlite(arr):
+    tipo = arr.type
+    if pa.types.is_timestamp(tipo):
+        if tipo.tz is not None:
+            arr = pc.cast(arr, pa.timestamp(tipo.unit))
+        # Mesmo texto que o to_sql grava (datetime.isoformat(" ")): frações de segundo só quando existem.
+        return texto_arrow(arr).to_pylist()
+    if pa.types.is_date(tipo):
+        return arr.cast(pa.string()).to_pylist()
+    if pa.types.is_time(tipo) or pa.types.is_null(tipo):
+        return arr.cast(pa.string()).to_pylist()
+    if pa.types.is_decimal(tipo):
+        return arr.cast(pa.float64()).to_pylist()
+    return arr.to_pylist()
+
+
+def aplicar_pragmas(conn, pragmas):
+    for nome, valor in pragmas.items():
+        conn.execute(f"PRAGMA {nome} = {valor}")
+
+
+def pragmas_bulk(sobrescritos=None):
+    pragmas = dict(SQLITE_BULK_PRAGMAS)
+    pragmas.update(sobrescritos or {})
+    return pragmas
+
+
+def criar_tabela(conn, nome_tabela, schema):
+    colunas = ", ".join(f"{_quote(f.name)} {_tipo_sqlite_arrow(f.type)}" for f in schema)
+    conn.execute(f"DROP TABLE IF EXISTS {_quote(nome_tabela)}")
+    conn.execute(f"CREATE TABLE {_quote(nome_tabela)} ({colunas})")
+
+
+def carregar_chunks(conn, nome_tabela, df_chunks):
+    total_rows = 0
+    schema = None
+    insert = None
+    for chunk in df_chunks:
+        tabela = _tabela_sqlite(chunk)
+        if schema is None:
+            schema = tabela.schema
+            criar_tabela(conn, nome_tabela, schema)
+            marcadores = ", ".join("?" for _ in schema)
+            insert = f"INSERT INTO {_quote(nome_tabela)} VALUES ({marcadores})"
+
+        colunas = [_coluna_sqlite(tabela.column(i).combine_chunks()) for i in range(tabela.num_columns)]
+        conn.executemany(insert, zip(*colunas))
+        total_rows += tabela.num_rows
+    return total_rows, schema
+
+
+def criar_indices(conn, nome_tabela, indices):
+    for indice in indices or []:
+        colunas = [indice] if isinstance(indice, str) else list(indice)
+        nome_indice = f"idx_{nome_tabela}_{'_'.join(colunas)}"
+        lista = ", ".join(_quote(c) for c in colunas)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote(nome_indice)} ON {_quote(nome_tabela)} ({lista})")
+        logging.info(f"Índice '{nome_indice}' criado em '{nome_tabela}'.")
@@ -0,0 +1,382 @@
+import datetime
+import decimal
+import html
+import math
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.datetime import to_excel
+from openpyxl.utils.exceptions import IllegalCharacterError
+from openpyxl.workbook.child import INVALID_TITLE_REGEX
+
+XLSX_DATETIME_FORMAT = 'YYYY-MM-DD HH:MM:SS'
+# Mesmos formatos que o openpyxl aplica a date, time e timedelta.
+FORMATOS_DATA = {
+    "datahora": XLSX_DATETIME_FORMAT,
+    "data": "yyyy-mm-dd",
+    "hora": "h:mm:ss",
+    "duracao": "[hh]:mm:ss",
+}
+# Marcador do índice de estilo, resolvido ao publicar. \x00 nunca aparece num texto (é caractere ilegal no XML).
+MARCADOR_ESTILO = '\x00'
+TAMANHO_BUFFER_XML = 1024 * 1024
+# Limites de uma planilha do Excel; acima deles o arquivo não abre.
+MAX_LINHAS_XLSX = 1048576
+MAX_COLUNAS_XLSX = 16384
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+TIPO_PLANILHA = NS_REL + "/worksheet"
+TIPO_ESTILOS = NS_REL + "/styles"
+TIPO_CALCCHAIN = NS_REL + "/calcChain"
+TIPO_DOCUMENTO = NS_REL + "/officeDocument"
+CONTEUDO_PLANILHA = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+CONTENT_TYPES = "[Content_Types].xml"
+
+CABECALHO_PLANILHA = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    f'<worksheet xmlns="{NS_MAIN}"><sheetData>\n'
+)
+RODAPE_PLANILHA = '</sheetData></worksheet>\n'
+
+_colunas = {}
+
+
+def _coluna(i):
+    letra = _colunas.get(i)
+    if letra is None:
+        letra = _colunas[i] = get_column_letter(i + 1)
+    return letra
+
+
+def _celula(valor):
+    # Retorna o trecho da célula depois de '<c r="A1"', ou None para deixá-la vazia.
+    if isinstance(valor, str):
+        if ILLEGAL_CHARACTERS_RE.search(valor):
+            raise IllegalCharacterError(f"{valor!r} cannot be used in worksheets.")
+        espaco = ' xml:space="preserve"' if valor != valor.strip() else ''
+        return f' t="inlineStr"><is><t{espaco}>{escape(valor)}</t></is></c>'
+    if isinstance(valor, (bool, np.bool_)):
+        return f' t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, np.integer)):
+        return f'><v>{int(valor)}</v></c>'
+    if isinstance(valor, (float, np.floating)):
+        return f'><v>{float(valor)!r}</v></c>' if math.isfinite(valor) else None
+    if isinstance(valor, decimal.Decimal):
+        return f'><v>{valor}</v></c>' if valor.is_finite() else None
+    if isinstance(valor, datetime.datetime):
+        estilo = "datahora"
+    elif isinstance(valor, datetime.date):
+        estilo = "data"
+    elif isinstance(valor, datetime.time):
+        estilo = "hora"
+    elif isinstance(valor, datetime.timedelta):
+        estilo = "duracao"
+    else:
+        return _celula(str(valor))
+    return f' s="{MARCADOR_ESTILO}{estilo}"><v>{to_excel(valor)!r}</v></c>'
+
+
+class PlanilhaXml:
+    # XML de uma planilha escrito em streaming num arquivo temporário. Os textos são inline (t="inlineStr"),
+    # então a planilha não depende do sharedStrings.xml e pode entrar em qualquer pacote .xlsx.
+    def __init__(self, nome):
+        if INVALID_TITLE_REGEX.search(nome):
+            raise ValueError(f"Nome de planilha inválido: '{nome}'.")
+        self.nome = nome
+        self.linhas = 0
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".xml", prefix="sync_planilha_") as tmp:
+            self.path = tmp.name
+        self._arquivo = open(self.path, 'w', encoding='utf-8', buffering=TAMANHO_BUFFER_XML)
+        self._arquivo.write(CABECALHO_PLANILHA)
+
+    def append(self, valores):
+        if self.linhas >= MAX_LINHAS_XLSX or len(valores) > MAX_COLUNAS_XLSX:
+            self.descartar()
+            raise ValueError(
+                f"A planilha '{self.nome}' passa do limite do Excel ({MAX_LINHAS_XLSX} linhas, {MAX_COLUNAS_XLSX} colunas). "
+                "Use outro formato_saida ou divida a consulta."
+            )
+        self.linhas += 1
+        linha = self.linhas
+        celulas = []
+        for i, valor in enumerate(valores):
+            if valor is None:
+                continue
+            celula = _celula(valor)
+            if celula is not None:
+                celulas.append(f'<c r="{_coluna(i)}{linha}"{celula}')
+        # Uma linha da planilha por linha do arquivo: a publicação substitui os marcadores de estilo linha a linha.
+        self._arquivo.write(f'<row r="{linha}">{"".join(celulas)}</row>\n')
+
+    def fechar(self):
+        self._arquivo.write(RODAPE_PLANILHA)
+        self._arquivo.close()
+
+    def copiar_para(self, destino, estilos):
+        with open(self.path, 'r', encoding='utf-8') as origem:
+            for linha in origem:
+                if MARCADOR_ESTILO in linha:
+                    for nome, indice in estilos.items():
+                        linha = linha.replace(f'{MARCADOR_ESTILO}{nome}"', f'{indice}"')
+                destino.write(linha.encode('utf-8'))
+
+    def descartar(self):
+        if not self._arquivo.closed:
+            self._arquivo.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _atributos(tag):
+    return {nome: html.unescape(valor) for nome, valor in re.findall(r'([\w:]+)="([^"]*)"', tag)}
+
+
+def _definir_count(abertura, total):
+    if re.search(r'\bcount="\d*"', abertura):
+        return re.sub(r'\bcount="\d*"', f'count="{total}"', abertura, count=1)
+    return abertura[:-1] + f' count="{total}">'
+
+
+def _registrar_estilos(xml):
+    # Garante em styles.xml um numFmt e um xf para cada formato de FORMATOS_DATA, reaproveitando os que já
+    # existem (publicações seguidas não fazem o arquivo crescer). Edita o texto para não reescrever o XML inteiro.
+    abertura_xfs = re.search(r'<(\w+:)?cellXfs\b[^>]*>', xml)
+    folha = re.search(r'<(\w+:)?styleSheet\b[^>]*>', xml)
+    if not abertura_xfs or not folha:
+        raise ValueError("styles.xml do workbook sem cellXfs.")
+    p = abertura_xfs.group(1) or ""
+
+    secao_fmts = re.search(rf'<{p}numFmts\b[^>]*/>|<{p}numFmts\b[^>]*>.*?</{p}numFmts>', xml, re.S)
+    existentes = {}
+    tags_fmts = re.findall(rf'<{p}numFmt\b[^>]*>', secao_fmts.group(0)) if secao_fmts else []
+    for tag in tags_fmts:
+        attrs = _atributos(tag)
+        existentes.setdefault(attrs.get("formatCode"), int(attrs.get("numFmtId", 0)))
+    proximo_id = max([163, *existentes.values()]) + 1
+    ids = {}
+    novos_fmts = []
+    for nome, codigo in FORMATOS_DATA.items():
+        if codigo not in existentes:
+            existentes[codigo] = proximo_id
+            novos_fmts.append(f'<{p}numFmt numFmtId="{proximo_id}" formatCode={quoteattr(codigo)}/>')
+            proximo_id += 1
+        ids[nome] = existentes[codigo]
+
+    if novos_fmts:
+        total = len(tags_fmts) + len(novos_fmts)
+        if not secao_fmts:
+            xml = xml[:folha.end()] + f'<{p}numFmts count="{total}">{"".join(novos_fmts)}</{p}numFmts>' + xml[folha.end():]
+        else:
+            texto = secao_fmts.group(0)
+            abertura = re.match(rf'<{p}numFmts\b[^>]*>', texto).group(0)
+            if abertura.endswith('/>'):
+                texto = _definir_count(abertura[:-2] + '>', total) + "".join(novos_fmts) + f'</{p}numFmts>'
+            else:
+                fechamento = f'</{p}numFmts>'
+                texto = _definir_count(abertura, total) + texto[len(abertura):-len(fechamento)] + "".join(novos_fmts) + fechamento
+            xml = xml[:secao_fmts.start()] + texto + xml[secao_fmts.end():]
+
+    secao_xfs = re.search(rf'<{p}cellXfs\b[^>]*/>|<{p}cellXfs\b[^>]*>.*?</{p}cellXfs>', xml, re.S)
+    texto = secao_xfs.group(0)
+    abertura = re.match(rf'<{p}cellXfs\b[^>]*>', texto).group(0)
+    corpo = "" if abertura.endswith('/>') else texto[len(abertura):-len(f'</{p}cellXfs>')]
+    xfs = re.findall(rf'<{p}xf\b[^>]*/>|<{p}xf\b[^>]*>.*?</{p}xf>', corpo, re.S)
+
+    indices = {}
+    novos_xfs = []
+    for nome, id_formato in ids.items():
+        for i, xf in enumerate(xfs):
+            attrs = _atributos(re.match(rf'<{p}xf\b[^>]*>', xf).group(0))
+            if (
+                xf.endswith('/>') and attrs.get("numFmtId") == str(id_formato)
+                and all(attrs.get(a, "0") == "0" for a in ("fontId", "fillId", "borderId", "xfId"))
+            ):
+                indices[nome] = i
+                break
+        else:
+            indices[nome] = len(xfs) + len(novos_xfs)
+            novos_xfs.append(f'<{p}xf numFmtId="{id_formato}" fontId="0" fillId="0" borderId="0" applyNumberFormat="1"/>')
+
+    if novos_xfs:
+        abertura = abertura[:-2] + '>' if abertura.endswith('/>') else abertura
+        texto = _definir_count(abertura, len(xfs) + len(novos_xfs)) + corpo + "".join(novos_xfs) + f'</{p}cellXfs>'
+        xml = xml[:secao_xfs.start()] + texto + xml[secao_xfs.end():]
+    return xml, indices
+
+
+def _caminho_rels(parte):
+    diretorio, nome = posixpath.split(parte)
+    return posixpath.join(diretorio, "_rels", nome + ".rels")
+
+
+def _resolver(base, alvo):
+    if alvo.startswith('/'):
+        return alvo[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base), alvo))
+
+
+def _relacoes(dados):
+    return [(r.get("Id"), r.get("Type"), r.get("Target")) for r in ET.fromstring(dados) if r.tag == f"{{{NS_PKG_REL}}}Relationship"]
+
+
+def _inserir_antes(xml, fechamento, trecho):
+    m = None
+    for m in re.finditer(rf'</(\w+:)?{fechamento}>', xml):
+        pass
+    if m is None:
+        raise ValueError(f"Elemento '{fechamento}' não encontrado no pacote do workbook.")
+    return xml[:m.start()] + trecho + xml[m.start():]
+
+
+def _prefixo(xml, elemento):
+    m = re.search(rf'<(\w+:)?{elemento}\b', xml)
+    return (m.group(1) or "") if m else ""
+
+
+def _remover_elemento(xml, elemento, atributo, valor):
+    return re.sub(rf'<(\w+:)?{elemento}\b[^>]*\b{atributo}={quoteattr(valor)}[^>]*/>', '', xml)
+
+
+def _pacote_vazio(destino, nome):
+    wb = Workbook()
+    wb.active.title = nome
+    wb.save(destino)
+
+
+def publicar_planilhas(origem, destino, planilhas):
+    # Grava em destino uma cópia do pacote origem com as planilhas (PlanilhaXml) substituídas ou acrescentadas.
+    # As partes das demais planilhas, o sharedStrings e o restante do pacote são copiados byte a byte.
+    base = None
+    if origem is None:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx", prefix="sync_base_") as tmp:
+            base = origem = tmp.name
+        _pacote_vazio(origem, planilhas[0].nome)
+    try:
+        with zipfile.ZipFile(origem) as zin:
+            _publicar(zin, destino, planilhas)
+    finally:
+        if base and os.path.exists(base):
+            os.remove(base)
+
+
+def _publicar(zin, destino, planilhas):
+    nomes_zip = set(zin.namelist())
+    ler = lambda parte: zin.read(parte).decode('utf-8')
+
+    parte_workbook = next(_resolver("", alvo) for _, tipo, alvo in _relacoes(zin.read("_rels/.rels")) if tipo == TIPO_DOCUMENTO)
+    rels_workbook = _caminho_rels(parte_workbook)
+    workbook_xml = ler(parte_workbook)
+    raiz = ET.fromstring(zin.read(parte_workbook))
+    if raiz.tag != f"{{{NS_MAIN}}}workbook":
+        raise ValueError("Formato de workbook não suportado (apenas Office Open XML transitional).")
+    rels_xml = ler(rels_workbook)
+    relacoes = {rid: (tipo, _resolver(parte_workbook, alvo)) for rid, tipo, alvo in _relacoes(zin.read(rels_workbook))}
+    content_types = ler(CONTENT_TYPES)
+
+    parte_estilos = next((parte for tipo, parte in relacoes.values() if tipo == TIPO_ESTILOS), None)
+    if parte_estilos is None:
+        raise ValueError("Workbook sem styles.xml.")
+    estilos_xml, estilos = _registrar_estilos(ler(parte_estilos))
+
+    # Nomes de planilha não diferenciam maiúsculas no Excel.
+    existentes = {}
+    ids = [0]
+    for sheet in raiz.iter(f"{{{NS_MAIN}}}sheet"):
+        ids.append(int(sheet.get("sheetId", 0)))
+        existentes[sheet.get("name").lower()] = relacoes.get(sheet.get(f"{{{NS_REL}}}id"))
+
+    substituidas = {}
+    novas = []
+    for planilha in planilhas:
+        existente = existentes.get(planilha.nome.lower())
+        if existente is None:
+            novas.append(planilha)
+        elif existente[0] == TIPO_PLANILHA:
+            substituidas[existente[1]] = planilha
+        else:
+            raise ValueError(f"'{planilha.nome}' já existe no workbook e não é uma planilha de dados.")
+
+    ignoradas = set()
+    if substituidas:
+        # As relações da planilha antiga (desenhos, tabelas, comentários) não valem para o conteúdo novo, e o
+        # calcChain pode citar fórmulas que deixaram de existir; o Excel o reconstrói ao abrir.
+        ignoradas |= {_caminho_rels(parte) for parte in substituidas}
+        for rid, (tipo, parte) in relacoes.items():
+            if tipo == TIPO_CALCCHAIN:
+                ignoradas.add(parte)
+                rels_xml = _remover_elemento(rels_xml, "Relationship", "Id", rid)
+                content_types = _remover_elemento(content_types, "Override", "PartName", "/" + parte)
+
+    adicionadas = {}
+    p_sheets = _prefixo(workbook_xml, "sheets")
+    p_rel = _prefixo(rels_xml, "Relationships")
+    p_types = _prefixo(content_types, "Types")
+    diretorio = posixpath.dirname(parte_workbook)
+    for planilha in novas:
+        n = 1
+        while posixpath.join(diretorio, f"worksheets/sheet{n}.xml") in nomes_zip | set(adicionadas):
+            n += 1
+        parte = posixpath.join(diretorio, f"worksheets/sheet{n}.xml")
+        n = 1
+        while f"rId{n}" in relacoes:
+            n += 1
+        rid = f"rId{n}"
+        relacoes[rid] = (TIPO_PLANILHA, parte)
+        ids.append(max(ids) + 1)
+        adicionadas[parte] = planilha
+
+        workbook_xml = _inserir_antes(
+            workbook_xml, "sheets",
+            f'<{p_sheets}sheet name={quoteattr(planilha.nome)} sheetId="{ids[-1]}" r:id="{rid}" xmlns:r="{NS_REL}"/>',
+        )
+        rels_xml = _inserir_antes(
+            rels_xml, "Relationships",
+            f'<{p_rel}Relationship Id="{rid}" Type="{TIPO_PLANILHA}" Target="/{parte}"/>',
+        )
+        content_types = _inserir_antes(
+            content_types, "Types",
+            f'<{p_types}Override PartName="/{parte}" ContentType="{CONTEUDO_PLANILHA}"/>',
+        )
+
+    alteradas = {
+        parte_workbook: workbook_xml,
+        rels_workbook: rels_xml,
+        CONTENT_TYPES: content_types,
+        parte_estilos: estilos_xml,
+    }
+    with zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            if info.filename in ignoradas:
+                continue
+            if info.filename in alteradas:
+                zout.writestr(_info_zip(info.filename, info.date_time), alteradas[info.filename].encode('utf-8'))
+            elif info.filename in substituidas:
+                _gravar_planilha(zout, info.filename, substituidas[info.filename], estilos)
+            else:
+                destino_info = _info_zip(info.filename, info.date_time, info.compress_type)
+                with zin.open(info) as src, zout.open(destino_info, 'w', force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as dst:
+                    shutil.copyfileobj(src, dst, TAMANHO_BUFFER_XML)
+        for parte, planilha in adicionadas.items():
+            _gravar_planilha(zout, parte, planilha, estilos)
+
+
+def _info_zip(nome, date_time=None, compress_type=zipfile.ZIP_DEFLATED):
+    info = zipfile.ZipInfo(nome, date_time=date_time or datetime.datetime.now().timetuple()[:6])
+    info.compress_type = compress_type
+    return info
+
+
+def _gravar_planilha(zout, parte, planilha, estilos):
+    with zout.open(_info_zip(parte), 'w', force_zip64=os.path.getsize(planilha.path) > zipfile.ZIP64_LIMIT) as dst:
+        planilha.copiar_para(dst, estilos)
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import pyarrow as pa
+from config.settings import CACHE_RESULTADOS
+
+LITERAIS_SQL = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+
+
+def normalizar_sql(consulta):
+    # Fora de literais e identificadores entre aspas, o HANA não diferencia maiúsculas nem espaços.
+    partes = LITERAIS_SQL.split(consulta.strip().rstrip(";"))
+    return "".join(p if i % 2 else re.sub(r"\s+", " ", p).upper() for i, p in enumerate(partes)).strip()
+
+
+def lotes_como_tuplas(lotes):
+    # Converte os RecordBatch do cache para o formato (colunas, linhas) do fetch_modo "tuplas".
+    try:
+        for batch in lotes:
+            yield batch.schema.names, list(zip(*(coluna.to_pylist() for coluna in batch.columns)))
+    finally:
+        lotes.close()
+
+
+class CacheResultados:
+    # Resultados de consultas em arquivos Arrow IPC no disco local. O mtime de cada arquivo é o início da
+    # extração (TTL) e o atime, atualizado a cada leitura, o último uso (LRU).
+    def __init__(self, diretorio, tamanho_max_mb):
+        self.diretorio = diretorio
+        self.tamanho_max_mb = tamanho_max_mb
+        self.tamanho_max_bytes = tamanho_max_mb * 2 ** 20
+        self.acertos = 0
+        self.faltas = 0
+        self._lock = threading.Lock()
+        self._locks_chaves = {}
+
+    def _caminho(self, consulta, parametros):
+        texto = json.dumps([normalizar_sql(consulta), list(parametros or [])], ensure_ascii=False, default=str)
+        return os.path.join(self.diretorio, hashlib.sha1(texto.encode('utf-8')).hexdigest() + ".arrow")
+
+    def _lock_chave(self, path):
+        with self._lock:
+            return self._locks_chaves.setdefault(path, threading.Lock())
+
+    def _registrar(self, acerto, nome, detalhe):
+        with self._lock:
+            if acerto:
+                self.acertos += 1
+            else:
+                self.faltas += 1
+            total = self.acertos + self.faltas
+            taxa = self.acertos / total
+        logging.info(
+            f"Cache de resultados: {'acerto' if acerto else 'falta'} para '{nome}' ({detalhe}). "
+            f"Taxa de acerto: {self.acertos}/{total} ({taxa:.0%})."
+        )
+
+    def _abrir_valido(self, path, ttl):
+        try:
+            info = os.stat(path)
+            idade = time.time() - info.st_mtime
+            if idade > ttl:
+                return None, f"resultado de {idade:.0f}s expirado"
+            leitor = pa.ipc.open_file(pa.memory_map(path))
+            os.utime(path, (time.time(), info.st_mtime))
+            return leitor, f"resultado de {idade:.0f}s"
+        except FileNotFoundError:
+            return None, "sem resultado em cache"
+        except (OSError, pa.ArrowInvalid) as e:
+            logging.warning(f"Arquivo de cache '{path}' ilegível. Ele será substituído. Detalhes: {e}")
+            return None, "arquivo de cache ilegível"
+
+    def aguardar(self, consulta, parametros):
+        # Espera a extração em andamento da mesma consulta, se houver. As tarefas chamam antes de pegar
+        # uma conexão do pool, para não segurar uma conexão parada enquanto outra tarefa extrai.
+        with self._lock_chave(self._caminho(consulta, parametros)):
+            pass
+
+    def buscar(self, consulta, parametros, ttl, fonte, nome="consulta"):
+        # fonte() abre o iterador de RecordBatch da consulta no HANA; só é chamada em caso de falta.
+        path = self._caminho(consulta, parametros)
+        leitor, detalhe = self._abrir_valido(path, ttl)
+        falta = False
+        restantes = None
+        if leitor is None:
+            # Tarefas simultâneas com a mesma consulta esperam a primeira extração em vez de repeti-la. O lock só
+            # cobre a extração: o arquivo é publicado antes de o primeiro lote seguir para a escrita da saída.
+            with self._lock_chave(path):
+                leitor, detalhe = self._abrir_valido(path, ttl)
+                if leitor is None:
+                    falta = True
+                    self._registrar(False, nome, detalhe)
+                    leitor, restantes = self._gravar(path, fonte())
+        if not falta:
+            self._registrar(True, nome, detalhe)
+        if restantes is not None:
+            yield from restantes
+            return
+        if leitor is not None:
+            for i in range(leitor.num_record_batches):
+                yield leitor.get_batch(i)
+
+    def _fechar_fonte(self, batches):
+        close = getattr(batches, "close", None)
+        if close:
+            close()
+
+    def _gravar(self, path, batches):
+        # Lê a extração inteira para o arquivo e o publica, devolvendo o leitor do arquivo publicado. Se os tipos
+        # mudarem no meio, nada é publicado e volta um iterador com os lotes já lidos e o restante da consulta.
+        os.makedirs(self.diretorio, exist_ok=True)
+        inicio = time.time()
+        with tempfile.NamedTemporaryFile(delete=False, dir=self.diretorio, suffix=".tmp") as tmp:
+            tmp_file = tmp.name
+        escritor = None
+        schema = None
+        incompativel = None
+        try:
+            for batch in batches:
+                if escritor is None:
+                    schema = batch.schema
+                    escritor = pa.ipc.new_file(tmp_file, schema)
+                try:
+                    escritor.write_batch(batch if batch.schema.equals(schema) else batch.cast(schema))
+                except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+                    logging.warning(f"Resultado não será guardado em cache: lotes com tipos incompatíveis ({e}).")
+                    incompativel = batch
+                    break
+            if escritor is not None:
+                escritor.close()
+        except BaseException:
+            self._fechar_fonte(batches)
+            if escritor is not None:
+                escritor.close()
+            os.remove(tmp_file)
+            raise
+
+        if incompativel is not None:
+            return None, self._sem_cache(tmp_file, incompativel, batches)
+        self._fechar_fonte(batches)
+        if escritor is None:
+            os.remove(tmp_file)
+            return None, None
+        os.replace(tmp_file, path)
+        os.utime(path, (time.time(), inicio))
+        # Aberto antes da limpeza por tamanho, que pode remover o próprio arquivo se ele passar do limite.
+        leitor = pa.ipc.open_file(pa.memory_map(path))
+        self._limitar_tamanho()
+        return leitor, None
+
+    def _sem_cache(self, tmp_file, batch, batches):
+        try:
+            with pa.OSFile(tmp_file) as arquivo:
+                leitor = pa.ipc.open_file(arquivo)
+                for i in range(leitor.num_record_batches):
+                    yield leitor.get_batch(i)
+            yield batch
+            yield from batches
+        finally:
+            self._fechar_fonte(batches)
+            os.remove(tmp_file)
+
+    def _limitar_tamanho(self):
+        entradas = []
+        for nome in os.listdir(self.diretorio):
+            if not nome.endswith(".arrow"):
+                continue
+            path = os.path.join(self.diretorio, nome)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entradas.append((info.st_atime, info.st_size, path))
+
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        for _, tamanho, path in sorted(entradas):
+            if total <= self.tamanho_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= tamanho
+            logging.info(f"Cache de resultados: '{os.path.basename(path)}' removido (menos usado recentemente) para respeitar o limite de {self.tamanho_max_mb:g} MB.")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def obter_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheResultados(CACHE_RESULTADOS["diretorio"], CACHE_RESULTADOS["tamanho_max_mb"])
+        return _cache
@@ -1,5 +1,49 @@
+import collections
+import contextlib
 import logging
+import os
+import threading
+import time
+import pyarrow as pa
 from hdbcli import dbapi
+from config.settings import POOL_SAP
+from config.credentials import renovar_credenciais_recusadas
+from sap.tamanho_lote import TamanhoLoteAdaptativo, estimar_bytes_linhas
+
+TIPOS_ARROW_HANA = {
+    1: pa.int16(),
+    2: pa.int16(),
+    3: pa.int32(),
+    4: pa.int64(),
+    6: pa.float32(),
+    7: pa.float64(),
+    8: pa.string(),
+    9: pa.string(),
+    10: pa.string(),
+    11: pa.string(),
+    12: pa.binary(),
+    13: pa.binary(),
+    14: pa.date32(),
+    15: pa.time64('us'),
+    16: pa.timestamp('us'),
+    25: pa.string(),
+    26: pa.string(),
+    27: pa.binary(),
+    28: pa.bool_(),
+    29: pa.string(),
+    30: pa.string(),
+    51: pa.string(),
+    52: pa.string(),
+    55: pa.string(),
+    61: pa.timestamp('us'),
+    62: pa.timestamp('us'),
+    63: pa.date32(),
+    64: pa.time64('us'),
+}
+TIPOS_DECIMAL_HANA = (5, 47)
+TIPOS_LOB_HANA = (25, 26, 27)
+# 10: authentication failed; 414: senha expirada, troca obrigatória.
+CODIGOS_FALHA_AUTENTICACAO_HANA = (10, 414)
 
 def conectar_sap(dados):
     address = dados.get("HOST")
@@ -15,6 +59,199 @@ def conectar_sap(dados):
     logging.info("Conexão SAP estabelecida.")
     return conn
 
+def falha_autenticacao(erro):
+    return getattr(erro, "errorcode", None) in CODIGOS_FALHA_AUTENTICACAO_HANA
+
+class PoolConexoesSAP:
+    def __init__(self, dados, tamanho_max=4, timeout_ocioso=300, timeout_checkout=120):
+        self._dados = dados
+        self.tamanho_max = max(1, int(tamanho_max))
+        self.timeout_ocioso = timeout_ocioso
+        self.timeout_checkout = timeout_checkout
+
+        self._ociosas = collections.deque()
+        self._total = 0
+        self._fechado = False
+        self._cond = threading.Condition()
+        self._contadores = {
+            "checkouts": 0,
+            "esperas": 0,
+            "criacoes": 0,
+            "falhas": 0,
+            "descartes": 0,
+        }
+
+    def atualizar_credenciais(self, dados):
+        # Só as novas conexões usam as credenciais novas; as sessões abertas continuam válidas no HANA.
+        with self._cond:
+            if dados != self._dados:
+                self._dados = dados
+                logging.info("Pool de conexões SAP passará a usar as credenciais renovadas.")
+
+    def _conectar(self):
+        dados = self._dados
+        try:
+            return conectar_sap(dados)
+        except dbapi.Error as e:
+            if not falha_autenticacao(e):
+                raise
+            logging.warning(f"HANA recusou as credenciais SAP. Detalhes: {e}")
+            novos = renovar_credenciais_recusadas(dados)
+            if novos == dados:
+                raise
+            self.atualizar_credenciais(novos)
+            return conectar_sap(novos)
+
+    def estatisticas(self):
+        with self._cond:
+            stats = dict(self._contadores)
+            stats["abertas"] = self._total
+            stats["ociosas"] = len(self._ociosas)
+            stats["em_uso"] = self._total - len(self._ociosas)
+        return stats
+
+    def _fechar_conexao(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _conexao_saudavel(self, conn):
+        try:
+            if not conn.isconnected():
+                return False
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1 FROM DUMMY")
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            return True
+        except dbapi.Error as e:
+            logging.warning(f"Conexão SAP do pool falhou na verificação de saúde e será descartada. Detalhes: {e}")
+            return False
+
+    def _remover_expiradas(self):
+        expiradas = []
+        limite = time.monotonic() - self.timeout_ocioso
+        while self._ociosas and self._ociosas[0][1] < limite:
+            expiradas.append(self._ociosas.popleft()[0])
+            self._total -= 1
+        return expiradas
+
+    def obter(self, bloquear=True):
+        # Com bloquear=False, devolve None em vez de esperar quando todas as conexões estão em uso.
+        prazo = time.monotonic() + self.timeout_checkout
+        while True:
+            conn = None
+            criar = esgotado = False
+            with self._cond:
+                if self._fechado:
+                    raise RuntimeError("Pool de conexões SAP encerrado.")
+
+                expiradas = self._remover_expiradas()
+                if self._ociosas:
+                    conn = self._ociosas.pop()[0]
+                elif self._total < self.tamanho_max:
+                    self._total += 1
+                    criar = True
+                elif not bloquear:
+                    esgotado = True
+                else:
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        raise RuntimeError(f"Tempo esgotado aguardando conexão SAP livre no pool ({self.timeout_checkout}s).")
+                    self._contadores["esperas"] += 1
+                    self._cond.wait(restante)
+
+            for expirada in expiradas:
+                self._fechar_conexao(expirada)
+
+            if esgotado:
+                return None
+            if criar:
+                try:
+                    conn = self._conectar()
+                except Exception:
+                    with self._cond:
+                        self._total -= 1
+                        self._contadores["falhas"] += 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._contadores["criacoes"] += 1
+                    self._contadores["checkouts"] += 1
+                return conn
+
+            if conn is not None:
+                if self._conexao_saudavel(conn):
+                    with self._cond:
+                        self._contadores["checkouts"] += 1
+                    return conn
+                self._fechar_conexao(conn)
+                with self._cond:
+                    self._total -= 1
+                    self._contadores["descartes"] += 1
+
+    def devolver(self, conn, descartar=False):
+        with self._cond:
+            if descartar or self._fechado:
+                self._total -= 1
+                self._contadores["descartes"] += 1
+            else:
+                self._ociosas.append((conn, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            self._fechar_conexao(conn)
+
+    @contextlib.contextmanager
+    def conexao(self):
+        conn = self.obter()
+        descartar = False
+        try:
+            yield conn
+        except dbapi.Error:
+            try:
+                descartar = not conn.isconnected()
+            except Exception:
+                descartar = True
+            raise
+        finally:
+            self.devolver(conn, descartar)
+
+    def fechar(self):
+        with self._cond:
+            self._fechado = True
+            conexoes = [c for c, _ in self._ociosas]
+            self._total -= len(conexoes)
+            self._ociosas.clear()
+            self._cond.notify_all()
+        for conn in conexoes:
+            self._fechar_conexao(conn)
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def obter_pool(dados):
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = PoolConexoesSAP(dados, **POOL_SAP)
+            _pool_pid = os.getpid()
+        else:
+            _pool.atualizar_credenciais(dados)
+        return _pool
+
+def fechar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            logging.info(f"Encerrando pool de conexões SAP. Estatísticas: {_pool.estatisticas()}")
+            _pool.fechar()
+        _pool = None
+
 def executar_consulta(conn, consulta):
     cursor = conn.cursor()
     try:
@@ -28,20 +265,81 @@ def executar_consulta(conn, consulta):
     finally:
         cursor.close()
 
-def executar_consulta_em_chunks(conn, consulta, chunk_size=10000):
+def executar_consulta_em_chunks(conn, consulta, chunk_size=10000, parametros=None):
     cursor = conn.cursor()
     try:
-        cursor.execute(consulta)
+        if parametros:
+            cursor.execute(consulta, parametros)
+        else:
+            cursor.execute(consulta)
         cols = [d[0] for d in cursor.description] if cursor.description else []
+        adaptativo = isinstance(chunk_size, TamanhoLoteAdaptativo)
         
         while True:
-            rows = cursor.fetchmany(chunk_size)
+            inicio = time.perf_counter()
+            rows = cursor.fetchmany(chunk_size.atual if adaptativo else chunk_size)
             if not rows:
                 break
+            if adaptativo:
+                chunk_size.observar(len(rows), time.perf_counter() - inicio, estimar_bytes_linhas(rows))
             yield cols, rows
             
     except dbapi.Error as e:
         logging.error(f"Erro de SQL ao executar a consulta em chunks. Detalhes: {e}")
         raise
     finally:
-        cursor.close()
\ No newline at end of file
+        cursor.close()
+
+def tipo_arrow_coluna(descricao):
+    type_code = descricao[1]
+    if type_code in TIPOS_DECIMAL_HANA:
+        precisao = descricao[4] if len(descricao) > 4 else None
+        escala = descricao[5] if len(descricao) > 5 else None
+        if precisao and 0 < precisao <= 38 and escala is not None and 0 <= escala <= precisao:
+            return pa.decimal128(precisao, escala)
+        return pa.float64()
+    return TIPOS_ARROW_HANA.get(type_code)
+
+def _array_arrow(valores, tipo, lob=False):
+    if lob:
+        valores = [v.read() if hasattr(v, 'read') else v for v in valores]
+    try:
+        return pa.array(valores, type=tipo)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, OverflowError):
+        return pa.array(valores)
+
+def linhas_para_record_batch(rows, cols, tipos, lobs):
+    colunas = zip(*rows)
+    arrays = [_array_arrow(list(valores), tipo, lob) for valores, tipo, lob in zip(colunas, tipos, lobs)]
+    return pa.RecordBatch.from_arrays(arrays, names=cols)
+
+def executar_consulta_arrow(conn, consulta, chunk_size=10000, parametros=None):
+    cursor = conn.cursor()
+    try:
+        if parametros:
+            cursor.execute(consulta, parametros)
+        else:
+            cursor.execute(consulta)
+        descricao = cursor.description or []
+        cols = [d[0] for d in descricao]
+        tipos = [tipo_arrow_coluna(d) for d in descricao]
+        lobs = [d[1] in TIPOS_LOB_HANA for d in descricao]
+
+        adaptativo = isinstance(chunk_size, TamanhoLoteAdaptativo)
+
+        while True:
+            inicio = time.perf_counter()
+            rows = cursor.fetchmany(chunk_size.atual if adaptativo else chunk_size)
+            if not rows:
+                break
+            segundos = time.perf_counter() - inicio
+            batch = linhas_para_record_batch(rows, cols, tipos, lobs)
+            if adaptativo:
+                chunk_size.observar(len(rows), segundos, batch.nbytes)
+            yield batch
+
+    except dbapi.Error as e:
+        logging.error(f"Erro de SQL ao executar a consulta em batches Arrow. Detalhes: {e}")
+        raise
+    finally:
+        cursor.close()
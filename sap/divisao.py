@@ -0,0 +1,178 @@
+import datetime
+import decimal
+import logging
+import queue
+import threading
+import pyarrow as pa
+from processing.pipeline import intercalar_fontes
+
+
+def _linhas(lote):
+    if isinstance(lote, pa.RecordBatch):
+        return lote.num_rows
+    return len(lote[1])
+
+
+def _limites(minimo, maximo, faixas):
+    if isinstance(minimo, int) and not isinstance(minimo, bool):
+        passo = max(1, -(-(maximo - minimo) // faixas))
+    elif isinstance(minimo, (float, decimal.Decimal, datetime.date)):
+        passo = (maximo - minimo) / faixas
+    else:
+        raise ValueError(f"tipo {type(minimo).__name__} não suportado (use uma coluna numérica ou de data, ou 'predicados')")
+    return sorted({minimo + passo * i for i in range(1, faixas)} - {minimo})
+
+
+class DivisaoConsulta:
+    # Divide consulta_sap em faixas de uma coluna (ou em predicados explícitos), executadas em conexões separadas.
+    def __init__(self, config, nome="consulta"):
+        self.nome = nome
+        self.coluna = config.get("coluna")
+        self.faixas = int(config.get("faixas", 4))
+        self.predicados = list(config.get("predicados") or [])
+        self.paralelismo = config.get("paralelismo")
+        self.verificar_contagem = config.get("verificar_contagem", True)
+        if not self.predicados and not self.coluna:
+            raise ValueError(f"Configuração 'divisao' da tarefa '{nome}' precisa de 'coluna' ou 'predicados'.")
+        if self.faixas < 1:
+            raise ValueError(f"Configuração 'divisao' da tarefa '{nome}' com 'faixas' menor que 1.")
+
+    def _base(self, consulta):
+        return consulta.strip().rstrip(";")
+
+    def _consultar_um(self, conn, sql, parametros):
+        cursor = conn.cursor()
+        try:
+            if parametros:
+                cursor.execute(sql, parametros)
+            else:
+                cursor.execute(sql)
+            return cursor.fetchone()
+        finally:
+            cursor.close()
+
+    def _predicados_faixas(self, conn, consulta, parametros):
+        coluna = f'"{self.coluna}"'
+        minimo, maximo = self._consultar_um(
+            conn, f"SELECT MIN({coluna}), MAX({coluna}) FROM ({self._base(consulta)}) AS divisao", parametros
+        )
+        if minimo is None:
+            return [("1 = 1", [])]
+        try:
+            limites = _limites(minimo, maximo, self.faixas)
+        except ValueError as e:
+            raise ValueError(f"Não foi possível dividir '{self.nome}' por {coluna}: {e}.") from None
+        if not limites:
+            return [("1 = 1", [])]
+
+        # A primeira e a última faixa são abertas: linhas fora do MIN/MAX lido (ou nulas) não ficam de fora.
+        partes = [(f"({coluna} < ? OR {coluna} IS NULL)", [limites[0]])]
+        for inicio, fim in zip(limites, limites[1:]):
+            partes.append((f"{coluna} >= ? AND {coluna} < ?", [inicio, fim]))
+        partes.append((f"{coluna} >= ?", [limites[-1]]))
+        return partes
+
+    def partes(self, conn, consulta, parametros=None):
+        if self.predicados:
+            predicados = [(p, []) for p in self.predicados]
+        else:
+            predicados = self._predicados_faixas(conn, consulta, parametros)
+        base = self._base(consulta)
+        return [
+            (f"SELECT * FROM ({base}) AS divisao WHERE {predicado}", list(parametros or []) + valores)
+            for predicado, valores in predicados
+        ]
+
+    def contar(self, conn, consulta, parametros=None):
+        return self._consultar_um(conn, f"SELECT COUNT(*) FROM ({self._base(consulta)}) AS divisao", parametros)[0]
+
+    def _reservar(self, pool, quantidade):
+        # Só pega conexões livres: esperar por elas aqui, segurando a conexão da tarefa, pode travar
+        # quando as demais estão com tarefas que também esperam (workers >= POOL_SAP_TAMANHO_MAX).
+        reservadas = []
+        while len(reservadas) < quantidade:
+            conn_faixa = pool.obter(bloquear=False)
+            if conn_faixa is None:
+                break
+            reservadas.append(conn_faixa)
+        return reservadas
+
+    def _liberar(self, pool, reservadas):
+        for conn_faixa in reservadas:
+            try:
+                descartar = not conn_faixa.isconnected()
+            except Exception:
+                descartar = True
+            pool.devolver(conn_faixa, descartar)
+
+    def executar(self, pool, conn, consulta, parametros, buscar, profundidade_fila=4):
+        partes = self.partes(conn, consulta, parametros)
+        contagem = {}
+        def contar():
+            try:
+                contagem["total"] = self.contar(conn, consulta, parametros)
+            except Exception as e:
+                contagem["erro"] = e
+
+        reservadas = []
+        thread_contagem = None
+        lotes = None
+        try:
+            # Uma conexão do pool fica com a tarefa (e com a contagem); as faixas usam as que estiverem livres.
+            desejado = min(len(partes), self.paralelismo or len(partes), max(1, pool.tamanho_max - 1))
+            reservadas = self._reservar(pool, desejado) if len(partes) > 1 else []
+            if reservadas:
+                paralelismo = len(reservadas)
+                if paralelismo < desejado:
+                    logging.warning(f"Pool SAP sem conexões livres suficientes para '{self.nome}': {paralelismo} de {desejado} faixas em paralelo.")
+                logging.info(f"Consulta de '{self.nome}' dividida em {len(partes)} faixas, {paralelismo} em paralelo.")
+                if self.verificar_contagem:
+                    thread_contagem = threading.Thread(target=contar, name=f"{self.nome}-contagem", daemon=True)
+                    thread_contagem.start()
+                livres = queue.Queue()
+                for conn_faixa in reservadas:
+                    livres.put(conn_faixa)
+
+                def fonte(sql, valores):
+                    def abrir():
+                        # Cada thread de busca roda uma faixa por vez, então sempre há uma conexão reservada livre.
+                        conn_faixa = livres.get()
+                        try:
+                            yield from buscar(conn_faixa, sql, valores)
+                        finally:
+                            livres.put(conn_faixa)
+                    return abrir
+                lotes = intercalar_fontes([fonte(sql, valores) for sql, valores in partes], paralelismo, profundidade_fila, self.nome)
+            else:
+                # Pool esgotado (ou uma única faixa): as faixas rodam em sequência na conexão da tarefa,
+                # e a contagem vem antes porque usa a mesma conexão.
+                if len(partes) > 1:
+                    logging.warning(f"Pool SAP sem conexões livres para '{self.nome}': {len(partes)} faixas em sequência na conexão da tarefa.")
+                if self.verificar_contagem:
+                    contar()
+                lotes = (lote for sql, valores in partes for lote in buscar(conn, sql, valores))
+
+            extraidas = 0
+            for lote in lotes:
+                extraidas += _linhas(lote)
+                yield lote
+
+            if thread_contagem:
+                thread_contagem.join()
+            if self.verificar_contagem:
+                if "erro" in contagem:
+                    raise contagem["erro"]
+                if extraidas != contagem["total"]:
+                    raise RuntimeError(
+                        f"Contagem divergente em '{self.nome}': {extraidas} linhas nas faixas e "
+                        f"{contagem['total']} na consulta sem divisão. A saída não será substituída."
+                    )
+                logging.info(f"Contagem de '{self.nome}' conferida: {extraidas} linhas.")
+        finally:
+            if lotes is not None:
+                # Encerra as threads de busca antes de devolver as conexões reservadas ao pool.
+                lotes.close()
+            if thread_contagem:
+                # A contagem usa a conexão da tarefa; ela só volta ao pool depois que a consulta terminar.
+                thread_contagem.join()
+            self._liberar(pool, reservadas)
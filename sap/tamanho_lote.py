@@ -0,0 +1,67 @@
+import logging
+import sys
+from config.settings import CHUNK_AUTO
+
+AMOSTRA_LINHAS = 100
+SUAVIZACAO = 0.5
+VARIACAO_MINIMA = 0.25
+CRESCIMENTO_MAXIMO = 4
+
+
+def estimar_bytes_linhas(rows):
+    # Estima a memória das tuplas devolvidas pelo driver a partir de uma amostra espaçada.
+    if not rows:
+        return 0
+    passo = max(1, len(rows) // AMOSTRA_LINHAS)
+    amostra = rows[::passo]
+    total = sum(sys.getsizeof(linha) + sum(sys.getsizeof(v) for v in linha) for linha in amostra)
+    return int(total / len(amostra) * len(rows))
+
+
+class TamanhoLoteAdaptativo:
+    # chunk_size "auto": parte de um tamanho inicial e, a cada fetchmany, recalcula o lote para ficar
+    # dentro do orçamento de memória e perto da latência alvo por lote.
+    def __init__(self, opcoes=None, nome="consulta"):
+        opcoes = {**CHUNK_AUTO, **(opcoes or {})}
+        self.nome = nome
+        self.minimo = int(opcoes["minimo"])
+        self.maximo = int(opcoes["maximo"])
+        self.orcamento_bytes = float(opcoes["memoria_mb"]) * 2 ** 20
+        self.latencia_alvo = float(opcoes["latencia_alvo"])
+        self.atual = min(self.maximo, max(self.minimo, int(opcoes["inicial"])))
+        self.bytes_por_linha = None
+        self.segundos_por_linha = None
+        self.lotes = 0
+        self.ajustes = 0
+
+    def _suavizar(self, anterior, novo):
+        return novo if anterior is None else anterior * (1 - SUAVIZACAO) + novo * SUAVIZACAO
+
+    def observar(self, linhas, segundos, bytes_lote):
+        if not linhas:
+            return
+        self.lotes += 1
+        self.bytes_por_linha = self._suavizar(self.bytes_por_linha, bytes_lote / linhas)
+        self.segundos_por_linha = self._suavizar(self.segundos_por_linha, segundos / linhas)
+
+        candidatos = [self.maximo, self.atual * CRESCIMENTO_MAXIMO]
+        if self.bytes_por_linha > 0:
+            candidatos.append(self.orcamento_bytes / self.bytes_por_linha)
+        if self.segundos_por_linha > 0:
+            candidatos.append(self.latencia_alvo / self.segundos_por_linha)
+        alvo = max(self.minimo, int(min(candidatos)))
+
+        if abs(alvo - self.atual) / self.atual >= VARIACAO_MINIMA:
+            logging.info(
+                f"Lote de '{self.nome}' ajustado de {self.atual} para {alvo} linhas "
+                f"({self.bytes_por_linha:.0f} bytes/linha, {self.segundos_por_linha * 1000:.3f} ms/linha no fetch)."
+            )
+            self.atual = alvo
+            self.ajustes += 1
+
+    def resumo(self):
+        return {
+            "chunk_size": self.atual,
+            "bytes_por_linha": round(self.bytes_por_linha) if self.bytes_por_linha is not None else None,
+            "ajustes": self.ajustes,
+        }
@@ -1,94 +1,319 @@
 import time
+import itertools
 import logging
 import datetime
 import pandas as pd
-import threading
+import signal
 
-from config.settings import carregar_tarefas, TAREFAS_JSON_FILE, HORARIO_PERMITIDO
-from config.credentials import obter_credenciais_sap
-from sap.connection import conectar_sap, executar_consulta_em_chunks
-from processing.dataframe_handler import aplicar_formatacoes_df
-from processing.file_writer import salvar_atomicamente
-from utils.scheduler import dentro_janela_permitida, proxima_janela_inicio
+from config.settings import carregar_tarefas, identificador_tarefa, TAREFAS_JSON_FILE, TAREFAS_VERIFICACAO_INTERVALO, TAREFAS_JITTER_INICIO, EXECUCAO, POOL_SAP, PIPELINE_PROFUNDIDADE_FILA, CACHE_RESULTADOS
+from config.credentials import obter_credenciais_sap, obter_provedor
+from sap.connection import obter_pool, fechar_pool, executar_consulta_em_chunks, executar_consulta_arrow
+from sap.tamanho_lote import TamanhoLoteAdaptativo
+from sap.divisao import DivisaoConsulta
+from sap.cache_resultados import obter_cache, lotes_como_tuplas
+from processing.dataframe_handler import PlanoFormatacao, reindexar_colunas
+from processing.file_writer import salvar_atomicamente, mesclar_atomicamente, EscritorWorkbookXlsx
+from processing.csv_paralelo import compressao_csv
+from processing.incremental import ExtracaoIncremental
+from processing.retomada import ExtracaoRetomavel
+from processing.pipeline import executar_em_pipeline
+from processing.fingerprint import DeteccaoAlteracoes
+from utils.scheduler import AgendaTarefa, Agendador, ObservadorArquivo
+from utils.executor import ExecutorTarefas
+from utils.metricas import MetricasExecucao, iniciar_servidor_metricas, registrar_resultado
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
 
 ERROR_RETRY_INTERVAL = 60
+# Padrão da chave "tentativas" do tarefas.json: espera fixa de ERROR_RETRY_INTERVAL, sem limite de tentativas.
+POLITICA_TENTATIVAS = {"espera": ERROR_RETRY_INTERVAL, "fator": 1, "espera_max": 3600, "max": None}
 JSON_CHECK_INTERVAL = 3600
-processamento_lock = threading.Lock()
 
-def calcular_proxima_execucao_agendada(agora_dt, horarios):
-    horarios_ordenados = sorted([datetime.datetime.strptime(h, '%H:%M').time() for h in horarios])
-
-    for horario in horarios_ordenados:
-        proximo_dt = agora_dt.replace(hour=horario.hour, minute=horario.minute, second=0, microsecond=0)
-        if proximo_dt > agora_dt:
-            return proximo_dt.timestamp()
-
-    proximo_dia = agora_dt + datetime.timedelta(days=1)
-    while proximo_dia.weekday() not in HORARIO_PERMITIDO['dias']:
-        proximo_dia += datetime.timedelta(days=1)
-
-    primeiro_horario = horarios_ordenados[0]
-    return proximo_dia.replace(hour=primeiro_horario.hour, minute=primeiro_horario.minute, second=0, microsecond=0).timestamp()
+def arquivo_destino(tarefa):
+    formato = tarefa.get("formato_saida", "xlsx")
+    return tarefa.get("arquivo_saida") or f"{tarefa['tabela']}.{formato}"
 
-def processar_tarefa(dados_conn, tarefa):
+def processar_tarefa(dados_conn, tarefa, escritor_xlsx=None, metricas=None):
     tabela_ou_planilha = tarefa["tabela"] 
     consulta = tarefa["consulta_sap"]
     formato = tarefa.get("formato_saida", "xlsx")
     
-    arquivo_saida = tarefa.get("arquivo_saida") 
-    
     colunas_esperadas = tarefa.get("colunas")
     xlsx_opts = tarefa.get('xlsx_options', {})
     chunk_size = tarefa.get('chunk_size', 10000)
+    fetch_modo = tarefa.get('fetch_modo', "arrow" if tarefa.get('arrow_nativo') else "tuplas")
+    pipeline = tarefa.get('pipeline', False)
+    profundidade_fila = tarefa.get('profundidade_fila', PIPELINE_PROFUNDIDADE_FILA)
+    plano = PlanoFormatacao(xlsx_opts)
+    opcoes_saida = tarefa.get(f'{formato}_options', {}) if formato in ('db', 'parquet', 'csv') else {}
     
-    if arquivo_saida:
-        filename = arquivo_saida
-    else:
-        filename = f"{tabela_ou_planilha}.{formato}"
-        
-    conn = None
+    filename = arquivo_destino(tarefa)
+    metricas = metricas or MetricasExecucao(tarefa)
+    if chunk_size == "auto":
+        chunk_size = TamanhoLoteAdaptativo(tarefa.get('chunk_auto'), nome=tabela_ou_planilha)
+
+    pool = obter_pool(dados_conn)
 
     try:
         logging.info(f"Iniciando processamento: '{tabela_ou_planilha}' -> {filename} (Formato: '{formato}')")
-        conn = conectar_sap(dados_conn)
+        incremental = ExtracaoIncremental(tarefa, filename) if tarefa.get("incremental") else None
+        consulta_exec, parametros = incremental.consulta(consulta) if incremental else (consulta, None)
+        deteccao = (
+            DeteccaoAlteracoes(tarefa, filename)
+            if tarefa.get("detectar_alteracoes") or tarefa.get("consulta_verificacao")
+            else None
+        )
+        divisao = DivisaoConsulta(tarefa["divisao"], tabela_ou_planilha) if tarefa.get("divisao") else None
+        retomada = ExtracaoRetomavel(tarefa, consulta_exec, parametros) if tarefa.get("retomada") else None
+        if retomada and divisao:
+            raise ValueError("as chaves 'retomada' e 'divisao' não podem ser usadas juntas")
+        if incremental and formato == 'csv' and compressao_csv(opcoes_saida) != "none":
+            raise ValueError("a mesclagem incremental não suporta CSV comprimido (csv_options.compressao)")
+        cache = obter_cache() if tarefa.get("cache") else None
+        ttl_cache = tarefa["cache"].get("ttl", CACHE_RESULTADOS["ttl"]) if isinstance(tarefa.get("cache"), dict) else CACHE_RESULTADOS["ttl"]
+        # O cache e os checkpoints guardam RecordBatch; tarefas em "tuplas" recebem os lotes convertidos.
+        modo_busca = "arrow" if cache or retomada else fetch_modo
 
-        def processar_chunks():
-            data_iterator = executar_consulta_em_chunks(conn, consulta, chunk_size)
-            primeiro_chunk = True
-            for cols, rows in data_iterator:
-                if primeiro_chunk and not rows:
-                    logging.warning(f"Consulta retornou 0 linhas para '{tabela_ou_planilha}'. Nenhum dado será escrito.")
-                    raise StopIteration
-                
+        if cache:
+            # Outra tarefa extraindo a mesma consulta: espera o cache antes de ocupar uma conexão do pool.
+            cache.aguardar(consulta_exec, parametros)
+        with pool.conexao() as conn:
+            if deteccao and deteccao.sonda_inalterada(conn):
+                metricas.evitada = deteccao.evitada
+                return True
+
+            def buscar(conn_busca, sql, valores):
+                if modo_busca == "arrow":
+                    return executar_consulta_arrow(conn_busca, sql, chunk_size, valores)
+                return executar_consulta_em_chunks(conn_busca, sql, chunk_size, valores)
+
+            def buscar_hana():
+                if retomada:
+                    return retomada.executar(lambda sql, valores: buscar(conn, sql, valores))
+                if divisao:
+                    return divisao.executar(pool, conn, consulta_exec, parametros, buscar, profundidade_fila)
+                return buscar(conn, consulta_exec, parametros)
+
+            def buscar_lotes():
+                if cache is None:
+                    lotes = buscar_hana()
+                else:
+                    lotes = cache.buscar(consulta_exec, parametros, ttl_cache, buscar_hana, tabela_ou_planilha)
+                return lotes if fetch_modo == modo_busca else lotes_como_tuplas(lotes)
+
+            def transformar_lote(lote):
+                if fetch_modo == "arrow":
+                    batch = plano.aplicar_arrow(lote)
+                    if incremental:
+                        incremental.observar(batch)
+                    if colunas_esperadas:
+                        batch = reindexar_colunas(batch, colunas_esperadas)
+                    return batch
+
+                cols, rows = lote
                 df_novo = pd.DataFrame(rows, columns=cols)
+                if incremental:
+                    incremental.observar(df_novo)
                 if colunas_esperadas:
                     df_novo = df_novo.reindex(columns=colunas_esperadas)
                 
-                df_formatado = aplicar_formatacoes_df(df_novo, xlsx_opts)
-                yield df_formatado
-                primeiro_chunk = False
-        
-        chunk_generator = processar_chunks()
-        try:
-            chunks = list(chunk_generator)
-            if not chunks:
-                logging.warning(f"Nenhum dado retornado para a tarefa '{tabela_ou_planilha}'.")
-                return True
-        except StopIteration:
-            return True
-        
-        return salvar_atomicamente(filename, chunks, formato, target_name=tabela_ou_planilha)
+                return plano.aplicar(df_novo)
+
+            lotes = metricas.medir_iterador(buscar_lotes(), "busca")
+            transformar = metricas.medir_funcao(transformar_lote, "transformacao")
+            if pipeline:
+                chunk_generator = executar_em_pipeline(lotes, transformar, profundidade_fila, nome=tabela_ou_planilha)
+            else:
+                chunk_generator = (transformar(lote) for lote in lotes)
+
+            try:
+                primeiro_chunk = next(chunk_generator, None)
+                if primeiro_chunk is None:
+                    logging.warning(f"Consulta retornou 0 linhas para '{tabela_ou_planilha}'. Nenhum dado será escrito.")
+                    return True
+                metricas.marcar_primeira_linha()
+                chunks = itertools.chain([primeiro_chunk], chunk_generator)
+
+                def escrever(chunks):
+                    if incremental and not incremental.completo and escritor_xlsx is None:
+                        return mesclar_atomicamente(filename, chunks, formato, target_name=tabela_ou_planilha, chaves=incremental.chaves, opcoes=opcoes_saida)
+                    if deteccao:
+                        chunks = deteccao.envolver(chunks)
+                    if escritor_xlsx is not None:
+                        return escritor_xlsx.escrever_planilha(tabela_ou_planilha, chunks)
+                    return salvar_atomicamente(filename, chunks, formato, target_name=tabela_ou_planilha, opcoes=opcoes_saida)
+
+                sucesso = metricas.medir_escrita(escrever, chunks)
+                if deteccao:
+                    metricas.evitada = deteccao.evitada
+                metricas.registrar_lote(chunk_size)
+
+                confirmacoes = [estado.registrar_sucesso for estado in (incremental, deteccao, retomada) if estado]
+                if sucesso and escritor_xlsx is not None:
+                    escritor_xlsx.confirmacoes.extend(confirmacoes)
+                elif sucesso:
+                    for confirmar in confirmacoes:
+                        confirmar()
+                return sucesso
+            finally:
+                chunk_generator.close()
+                # Fechar a expressão geradora não fecha o iterador de origem: o cursor do HANA é fechado aqui,
+                # antes de a conexão voltar ao pool.
+                lotes.close()
     except Exception as e:
         logging.error(f"Falha ao processar a tarefa '{tabela_ou_planilha}'. Causa: {e}")
         return False
     finally:
-        if conn:
-            try:
-                conn.close()
-            except Exception:
-                pass
+        logging.debug(f"Pool de conexões SAP: {pool.estatisticas()}")
+
+def executar_tarefa(dados_conn, tarefa):
+    metricas = MetricasExecucao(tarefa)
+    sucesso = processar_tarefa(dados_conn, tarefa, metricas=metricas)
+    return metricas.finalizar(sucesso, arquivo_destino(tarefa))
+
+def processar_grupo_xlsx(dados_conn, tarefas):
+    filename = arquivo_destino(tarefas[0])
+    logging.info(f"Gravando {len(tarefas)} planilhas em '{filename}' numa única passada: {', '.join(t['tabela'] for t in tarefas)}.")
+    escritor = EscritorWorkbookXlsx(filename)
+    try:
+        metricas = []
+        sucessos = []
+        for tarefa in tarefas:
+            metricas.append(MetricasExecucao(tarefa))
+            sucessos.append(processar_tarefa(dados_conn, tarefa, escritor, metricas[-1]))
+        if any(sucessos):
+            # Todas as tarefas do grupo aguardam a publicação do workbook; o tempo entra na escrita de cada uma.
+            inicio_publicacao = time.perf_counter()
+            if not escritor.publicar():
+                sucessos = [False] * len(tarefas)
+            duracao_publicacao = time.perf_counter() - inicio_publicacao
+            for m in metricas:
+                m.acumular("escrita", duracao_publicacao)
+        return [m.finalizar(s, filename) for m, s in zip(metricas, sucessos)]
+    finally:
+        escritor.descartar()
+
+def agrupar_pendentes(pendentes):
+    grupos = []
+    por_arquivo = {}
+    for item in pendentes:
+        tarefa_config = item['config']
+        if tarefa_config.get("formato_saida", "xlsx") != "xlsx":
+            grupos.append([item])
+            continue
+        arquivo = arquivo_destino(tarefa_config)
+        if arquivo not in por_arquivo:
+            por_arquivo[arquivo] = []
+            grupos.append(por_arquivo[arquivo])
+        por_arquivo[arquivo].append(item)
+    return grupos
+
+def reagendar_tarefa(item, sucesso):
+    tarefa_config = item['config']
+    inicio_dt = datetime.datetime.fromtimestamp(item['inicio_execucao'])
+
+    if sucesso:
+        item['falhas_consecutivas'] = 0
+        item['proxima_execucao'] = item['agenda'].proxima_execucao(inicio_dt)
+        proxima_exec_dt = datetime.datetime.fromtimestamp(item['proxima_execucao'])
+        logging.info(f"Tarefa '{tarefa_config['tabela']}' concluída. Próxima execução agendada para {proxima_exec_dt.strftime('%Y-%m-%d %H:%M:%S')}.")
+        return
+
+    politica = {**POLITICA_TENTATIVAS, **(tarefa_config.get('tentativas') or {})}
+    falhas = item.get('falhas_consecutivas', 0) + 1
+    if politica['max'] is not None and falhas > politica['max']:
+        item['falhas_consecutivas'] = 0
+        item['proxima_execucao'] = item['agenda'].proxima_execucao(inicio_dt)
+        proxima_exec_dt = datetime.datetime.fromtimestamp(item['proxima_execucao'])
+        logging.error(f"Tarefa '{tarefa_config['tabela']}' falhou após {politica['max']} novas tentativas. Próxima execução agendada para {proxima_exec_dt.strftime('%Y-%m-%d %H:%M:%S')}.")
+        return
+
+    item['falhas_consecutivas'] = falhas
+    espera = min(politica['espera_max'], politica['espera'] * politica['fator'] ** (falhas - 1))
+    item['proxima_execucao'] = item['agenda'].nova_tentativa(inicio_dt, espera)
+    logging.error(f"Tarefa '{tarefa_config['tabela']}' falhou ({falhas}ª falha seguida). Nova tentativa agendada em {espera:.0f}s.")
+
+def concluir_tarefa(item, resultado):
+    registrar_resultado(resultado, item['inicio_execucao'] - item['proxima_execucao'])
+    reagendar_tarefa(item, bool(resultado))
+
+def criar_item(config, agora_dt):
+    agenda = AgendaTarefa(config)
+    return {
+        'id': identificador_tarefa(config),
+        'config': config,
+        'agenda': agenda,
+        'proxima_execucao': agenda.primeira_execucao(agora_dt, TAREFAS_JITTER_INICIO, arquivo_destino(config)),
+    }
+
+def atualizar_tarefas(ativas, configs, agora_dt, agendador):
+    # Compara a nova configuração com a atual pelo identificador estável de cada tarefa. Tarefas inalteradas
+    # mantêm o item (próxima execução e execução em andamento); só as novas, alteradas e removidas são reagendadas.
+    novas = {}
+    adicionadas, alteradas = [], []
+    for config in configs:
+        try:
+            id_tarefa = identificador_tarefa(config)
+            if id_tarefa in novas:
+                logging.error(f"Tarefa '{id_tarefa}' duplicada no arquivo de tarefas. Apenas a primeira ocorrência será usada.")
+                continue
+            atual = ativas.get(id_tarefa)
+            if atual is not None and atual['config'] == config:
+                novas[id_tarefa] = atual
+                continue
+            novas[id_tarefa] = criar_item(config, agora_dt)
+        except (ValueError, KeyError) as e:
+            logging.error(f"Agendamento inválido para a tarefa '{config.get('tabela')}': {e}. A tarefa será ignorada.")
+            continue
+        (alteradas if atual is not None else adicionadas).append(novas[id_tarefa])
+
+    for id_tarefa, item in ativas.items():
+        if novas.get(id_tarefa) is not item:
+            agendador.cancelar(item)
+    removidas = [item for id_tarefa, item in ativas.items() if id_tarefa not in novas]
+    for item in removidas:
+        logging.info(f"Tarefa '{item['config']['tabela']}' removida.")
+    for situacao, itens in (("adicionada", adicionadas), ("alterada", alteradas)):
+        for item in itens:
+            agendador.agendar(item)
+            proxima_dt = datetime.datetime.fromtimestamp(item['proxima_execucao'])
+            logging.info(f"Tarefa '{item['config']['tabela']}' {situacao}. Primeira execução em {proxima_dt.strftime('%Y-%m-%d %H:%M:%S')}.")
+
+    if adicionadas or alteradas or removidas:
+        mantidas = len(novas) - len(adicionadas) - len(alteradas)
+        logging.info(f"Tarefas atualizadas: {len(adicionadas)} novas, {len(alteradas)} alteradas, {len(removidas)} removidas, {mantidas} mantidas.")
+    return novas
+
+def instalar_sinais(agendador, modo_execucao):
+    def interromper(*_):
+        # No modo serial a tarefa roda na thread principal: o CTRL+C a interrompe na hora (os finally limpam
+        # os temporários). Nos demais, o primeiro pede um encerramento gracioso e o segundo interrompe sem esperar.
+        if modo_execucao == "serial":
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        logging.info("Encerramento solicitado. Pressione CTRL+C novamente para interromper sem aguardar as tarefas em andamento.")
+        agendador.solicitar_encerramento()
+
+    signal.signal(signal.SIGINT, interromper)
+    signal.signal(signal.SIGTERM, lambda *_: agendador.solicitar_encerramento())
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda *_: agendador.solicitar_recarga())
+
+def iniciar_grupo(executor, agendador, grupo, dados_conn, agora_ts):
+    arquivo = arquivo_destino(grupo[0]['config'])
+    limites = [i['config'].get("max_concorrencia") for i in grupo if i['config'].get("max_concorrencia")]
+    limite = min(limites) if limites else None
+    if not executor.pode_iniciar(arquivo, limite):
+        return False
+
+    for item in grupo:
+        item['inicio_execucao'] = agora_ts
+    if len(grupo) == 1:
+        future = executor.submeter(grupo[0], arquivo, limite, executar_tarefa, dados_conn, grupo[0]['config'])
+    else:
+        future = executor.submeter(grupo, arquivo, limite, processar_grupo_xlsx, dados_conn, [i['config'] for i in grupo])
+    future.add_done_callback(lambda _: agendador.despertar())
+    return True
 
 def main():
     logging.info("Iniciando sincronizador (CTRL+C para parar).")
@@ -98,97 +323,103 @@ def main():
     except Exception:
         logging.exception("Falha crítica ao obter credenciais do Firebase. Abortando.")
         return
+    provedor_credenciais = obter_provedor()
+    provedor_credenciais.iniciar_renovacao()
 
-    tarefas_ativas = []
+    try:
+        executor = ExecutorTarefas(EXECUCAO['modo'], EXECUCAO['max_workers'])
+    except ValueError:
+        logging.exception("Configuração de execução inválida. Abortando.")
+        return
+    if EXECUCAO['modo'] == "thread" and POOL_SAP['tamanho_max'] <= EXECUCAO['max_workers']:
+        # No modo thread os workers dividem um único pool; cada tarefa já ocupa uma conexão.
+        logging.warning(
+            f"POOL_SAP_TAMANHO_MAX ({POOL_SAP['tamanho_max']}) não é maior que EXECUCAO_MAX_WORKERS ({EXECUCAO['max_workers']}): "
+            "consultas com 'divisao' podem rodar com menos faixas em paralelo (ou em sequência) quando o pool estiver cheio."
+        )
+
+    iniciar_servidor_metricas()
+
+    agendador = Agendador()
+    instalar_sinais(agendador, EXECUCAO['modo'])
+    observador = ObservadorArquivo(TAREFAS_JSON_FILE, agendador.solicitar_recarga, TAREFAS_VERIFICACAO_INTERVALO)
+
+    tarefas_ativas = {}
+    aguardando_vaga = []
     proximo_check_json_ts = 0
 
-    while True:
+    while not agendador.encerramento_solicitado:
         try:
-            if not processamento_lock.acquire(blocking=False):
-                time.sleep(1)
-                continue
+            agora_ts = time.time()
+            agora_dt = datetime.datetime.fromtimestamp(agora_ts)
 
-            try:
-                agora_ts = time.time()
-                agora_dt = datetime.datetime.fromtimestamp(agora_ts)
-
-                if agora_ts >= proximo_check_json_ts:
-                    logging.info(f"Verificando o arquivo '{TAREFAS_JSON_FILE}' para atualizações...")
-                    novas_tarefas_config = carregar_tarefas()
-                    
-                    if novas_tarefas_config is not None:
-                        configs_atuais = [t['config'] for t in tarefas_ativas]
-                        if novas_tarefas_config != configs_atuais:
-                            logging.info("Detectada nova configuração. Atualizando a lista de tarefas.")
-                            tarefas_ativas = []
-                            for t in novas_tarefas_config:
-                                horarios = t.get("horarios_execucao")
-                                proxima_execucao = (
-                                    calcular_proxima_execucao_agendada(agora_dt, horarios)
-                                    if horarios
-                                    else agora_ts
-                                )
-                                tarefas_ativas.append({'config': t, 'proxima_execucao': proxima_execucao})
-
-                    elif not tarefas_ativas:
-                        logging.warning(f"Nenhuma tarefa configurada. Tentando novamente em {JSON_CHECK_INTERVAL}s.")
-
-                    proximo_check_json_ts = agora_ts + JSON_CHECK_INTERVAL
-
-                if not tarefas_ativas:
-                    time.sleep(5)
-                    continue
-
-                if not dentro_janela_permitida(agora_dt):
-                    next_start_ts = proxima_janela_inicio(agora_dt)
-                    logging.info(f"Fora da janela permitida. Próxima execução às {datetime.datetime.fromtimestamp(next_start_ts)}.")
-                    sleep_secs = max(1, next_start_ts - agora_ts)
-                    time.sleep(sleep_secs)
-                    continue
-                
-                tarefa_executada_neste_ciclo = False
-                for item in tarefas_ativas:
-                    if agora_ts >= item['proxima_execucao']:
-                        tarefa_executada_neste_ciclo = True
-                        tarefa_config = item['config']
-                        sucesso = processar_tarefa(dados_conn, tarefa_config)
-                        
-                        horarios = tarefa_config.get("horarios_execucao")
-                        if sucesso:
-                            if horarios:
-                                proxima_exec = calcular_proxima_execucao_agendada(agora_dt, horarios)
-                                item['proxima_execucao'] = proxima_exec
-                                proxima_exec_dt = datetime.datetime.fromtimestamp(proxima_exec)
-                                logging.info(f"Tarefa '{tarefa_config['tabela']}' concluída. Próxima execução agendada para {proxima_exec_dt.strftime('%Y-%m-%d %H:%M:%S')}.")
-                            else:
-                                intervalo = tarefa_config.get("intervalo", 300)
-                                proxima_exec_ts = agora_ts + intervalo
-                                item['proxima_execucao'] = proxima_exec_ts
-                                proxima_exec_dt = datetime.datetime.fromtimestamp(proxima_exec_ts)
-                                logging.info(f"Tarefa '{tarefa_config['tabela']}' concluída. Próxima execução às {proxima_exec_dt.strftime('%Y-%m-%d %H:%M:%S')}.")
-                        else:
-                            item['proxima_execucao'] = agora_ts + ERROR_RETRY_INTERVAL
-                            logging.error(f"Tarefa '{tarefa_config['tabela']}' falhou. Nova tentativa agendada em {ERROR_RETRY_INTERVAL}s.")
-                
-                if tarefa_executada_neste_ciclo:
-                    if tarefas_ativas:
-                        proxima_tarefa_agendada = min(tarefas_ativas, key=lambda t: t['proxima_execucao'])
-                        nome_tarefa = proxima_tarefa_agendada['config']['tabela']
-                        proximo_ts = proxima_tarefa_agendada['proxima_execucao']
-                        proximo_dt = datetime.datetime.fromtimestamp(proximo_ts)
-                        logging.info(f"Próxima tarefa na fila: '{nome_tarefa}', agendada para {proximo_dt.strftime('%Y-%m-%d %H:%M:%S')}.")
+            concluidas = executor.coletar_concluidas()
+            for item, resultado in concluidas:
+                concluir_tarefa(item, resultado)
+                agendador.agendar(item)
+            if concluidas:
+                # Uma vaga (ou arquivo) foi liberada: as tarefas que esperavam voltam para a fila.
+                for item in aguardando_vaga:
+                    agendador.agendar(item)
+                aguardando_vaga = []
+
+            if agendador.recarga_solicitada or agora_ts >= proximo_check_json_ts:
+                agendador.recarga_solicitada = False
+                logging.info(f"Verificando o arquivo '{TAREFAS_JSON_FILE}' para atualizações...")
+                novas_tarefas_config = carregar_tarefas()
+
+                if novas_tarefas_config is not None:
+                    tarefas_ativas = atualizar_tarefas(tarefas_ativas, novas_tarefas_config, agora_dt, agendador)
+                    aguardando_vaga = [item for item in aguardando_vaga if not item.get('cancelado')]
+
+                elif not tarefas_ativas:
+                    logging.warning(f"Nenhuma tarefa configurada. Tentando novamente em {JSON_CHECK_INTERVAL}s.")
 
+                proximo_check_json_ts = agora_ts + JSON_CHECK_INTERVAL
+
+            vencidos = agendador.retirar_vencidos(agora_ts)
+            pendentes = {id(item): item for item in vencidos}
+            try:
+                if vencidos:
+                    # Credenciais renovadas (pelo TTL ou após uma recusa do HANA num worker) valem para as próximas tarefas.
+                    dados_conn = obter_credenciais_sap()
+                for grupo in agrupar_pendentes(vencidos):
+                    if not iniciar_grupo(executor, agendador, grupo, dados_conn, agora_ts):
+                        aguardando_vaga.extend(grupo)
+                    for item in grupo:
+                        pendentes.pop(id(item), None)
             finally:
-                processamento_lock.release()
+                # Itens já retirados da fila que não foram submetidos (falha nas credenciais ou na submissão)
+                # voltam para a fila em vez de se perderem.
+                for item in pendentes.values():
+                    agendador.agendar(item)
 
-            time.sleep(1)
+            if concluidas:
+                proxima_tarefa_agendada = agendador.proximo()
+                if proxima_tarefa_agendada:
+                    nome_tarefa = proxima_tarefa_agendada['config']['tabela']
+                    proximo_dt = datetime.datetime.fromtimestamp(proxima_tarefa_agendada['proxima_execucao'])
+                    logging.info(f"Próxima tarefa na fila: '{nome_tarefa}', agendada para {proximo_dt.strftime('%Y-%m-%d %H:%M:%S')}.")
+
+            despertar_ts = proximo_check_json_ts
+            proxima = agendador.proximo()
+            if proxima:
+                despertar_ts = min(despertar_ts, proxima['proxima_execucao'])
+            if despertar_ts - time.time() > 60:
+                logging.info(f"Aguardando até {datetime.datetime.fromtimestamp(despertar_ts).strftime('%Y-%m-%d %H:%M:%S')} (ou até uma alteração em '{TAREFAS_JSON_FILE}').")
+            agendador.aguardar(despertar_ts)
 
         except KeyboardInterrupt:
-            logging.info("Interrupção pelo usuário. Encerrando.")
-            break
+            agendador.solicitar_encerramento()
         except Exception:
             logging.exception("Erro inesperado no loop principal. O processo continuará.")
             time.sleep(10)
 
+    logging.info("Encerramento solicitado. Encerrando.")
+    observador.parar()
+    provedor_credenciais.parar_renovacao()
+    executor.encerrar(aguardar=False)
+    fechar_pool()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
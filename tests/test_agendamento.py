@@ -0,0 +1,30 @@
+import datetime
+import os
+
+os.environ.setdefault("FIREBASE_CRED_JSON", "firebase.json")
+os.environ.setdefault("SECRET_KEY_FILE", "secret.key")
+os.environ.setdefault("TAREFAS_JSON_FILE", "tarefas.json")
+
+from sap_sync_main import agrupar_pendentes, criar_item
+from utils.scheduler import Agendador
+import sap_sync_main
+
+
+def test_planilhas_do_mesmo_arquivo_continuam_agrupadas_com_jitter(monkeypatch):
+    monkeypatch.setattr(sap_sync_main, "TAREFAS_JITTER_INICIO", 30)
+    janela = {"dias": list(range(7)), "hora_inicio": 0, "hora_fim": 24}
+    configs = [
+        {"tabela": "Vendas", "arquivo_saida": "relatorio.xlsx", "consulta_sap": "SELECT 1 FROM DUMMY", "intervalo": 600, "janela": janela},
+        {"tabela": "Estoque", "arquivo_saida": "relatorio.xlsx", "consulta_sap": "SELECT 2 FROM DUMMY", "intervalo": 600, "janela": janela},
+    ]
+    agora = datetime.datetime(2026, 1, 5, 12, 0)
+    itens = [criar_item(config, agora) for config in configs]
+
+    assert itens[0]['proxima_execucao'] == itens[1]['proxima_execucao']
+    assert itens[0]['proxima_execucao'] > agora.timestamp()
+
+    agendador = Agendador()
+    for item in itens:
+        agendador.agendar(item)
+    grupos = agrupar_pendentes(agendador.retirar_vencidos(itens[0]['proxima_execucao']))
+    assert [[i['config']['tabela'] for i in grupo] for grupo in grupos] == [["Vendas", "Estoque"]]
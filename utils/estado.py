@@ -0,0 +1,48 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from config.settings import ESTADO_DIR
+
+
+def _caminho_estado(namespace, chave):
+    nome = hashlib.sha1(chave.encode('utf-8')).hexdigest()
+    return os.path.join(ESTADO_DIR, namespace, f"{nome}.json")
+
+
+def carregar_estado(namespace, chave):
+    path = _caminho_estado(namespace, chave)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"Estado '{namespace}' da chave '{chave}' ilegível em '{path}'. Ignorando. Detalhes: {e}")
+        return {}
+
+
+def salvar_estado(namespace, chave, dados):
+    path = _caminho_estado(namespace, chave)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_file = None
+    try:
+        with tempfile.NamedTemporaryFile('w', delete=False, dir=os.path.dirname(path), suffix=".tmp", encoding='utf-8') as tmp:
+            tmp_file = tmp.name
+            json.dump(dict(dados, chave=chave), tmp, ensure_ascii=False, default=str)
+        os.replace(tmp_file, path)
+        tmp_file = None
+    finally:
+        if tmp_file and os.path.exists(tmp_file):
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+
+
+def remover_estado(namespace, chave):
+    try:
+        os.remove(_caminho_estado(namespace, chave))
+    except FileNotFoundError:
+        pass
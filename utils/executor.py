@@ -0,0 +1,94 @@
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+MODOS_EXECUCAO = ("serial", "thread", "process")
+
+
+class ExecutorTarefas:
+    def __init__(self, modo="serial", max_workers=1):
+        if modo not in MODOS_EXECUCAO:
+            raise ValueError(f"Modo de execução '{modo}' inválido. Valores suportados: {', '.join(MODOS_EXECUCAO)}.")
+
+        self.modo = modo
+        self.max_workers = 1 if modo == "serial" else max(1, int(max_workers))
+        self._pool = self._criar_pool()
+
+        self._em_execucao = {}
+        self._arquivos_ocupados = set()
+        logging.info(f"Executor de tarefas iniciado (modo='{self.modo}', max_workers={self.max_workers}).")
+
+    def _criar_pool(self):
+        if self.modo == "thread":
+            return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tarefa")
+        if self.modo == "process":
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+        return None
+
+    def em_execucao(self):
+        return len(self._em_execucao)
+
+    def pode_iniciar(self, arquivo, limite_tarefa=None):
+        if arquivo in self._arquivos_ocupados:
+            return False
+
+        limite = self.max_workers
+        if limite_tarefa:
+            limite = min(limite, int(limite_tarefa))
+        for _, _, limite_ativo in self._em_execucao.values():
+            if limite_ativo:
+                limite = min(limite, int(limite_ativo))
+
+        return len(self._em_execucao) < limite
+
+    def submeter(self, item, arquivo, limite_tarefa, funcao, *args):
+        if self._pool is None:
+            future = Future()
+            try:
+                future.set_result(funcao(*args))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            try:
+                future = self._pool.submit(funcao, *args)
+            except BrokenProcessPool:
+                # Um worker morreu (ex: OOM) e o pool não aceita mais envios: as tarefas em andamento já
+                # receberam o erro e serão reagendadas; um pool novo recebe esta e as próximas.
+                logging.error("Pool de processos quebrado (um worker foi encerrado abruptamente). Recriando o pool.")
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._criar_pool()
+                future = self._pool.submit(funcao, *args)
+
+        for i in self._itens(item):
+            i['em_execucao'] = True
+        self._arquivos_ocupados.add(arquivo)
+        self._em_execucao[future] = (item, arquivo, limite_tarefa)
+        return future
+
+    @staticmethod
+    def _itens(item):
+        # Um grupo de tarefas (lista de itens) é executado por uma única chamada, que devolve um resultado por item.
+        return item if isinstance(item, list) else [item]
+
+    def coletar_concluidas(self):
+        concluidas = []
+        for future in [f for f in self._em_execucao if f.done()]:
+            item, arquivo, _ = self._em_execucao.pop(future)
+            self._arquivos_ocupados.discard(arquivo)
+            itens = self._itens(item)
+            for i in itens:
+                i['em_execucao'] = False
+
+            try:
+                resultado = future.result()
+                sucessos = resultado if isinstance(item, list) else [resultado]
+            except Exception:
+                nomes = ", ".join(i['config'].get('tabela') for i in itens)
+                logging.exception(f"Erro não tratado na execução da(s) tarefa(s) '{nomes}'.")
+                sucessos = [False] * len(itens)
+            concluidas.extend(zip(itens, sucessos))
+        return concluidas
+
+    def encerrar(self, aguardar=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=aguardar, cancel_futures=not aguardar)
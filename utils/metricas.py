@@ -0,0 +1,328 @@
+import datetime
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config.settings import METRICAS, identificador_tarefa
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PREFIXO = "sap_sync"
+BUCKETS_DURACAO = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+CONTENT_TYPE_OPENMETRICS = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+DESCRICOES = {
+    "execucoes": "Execuções de tarefas por resultado.",
+    "linhas": "Linhas extraídas e escritas.",
+    "bytes_escritos": "Bytes gravados nos arquivos de saída.",
+    "duracao_segundos": "Duração das etapas de cada execução.",
+    "atraso_agendamento_segundos": "Atraso entre a execução agendada e o início real.",
+    "linhas_por_segundo": "Vazão da última execução.",
+    "rss_pico_bytes": "Pico de memória residente do processo que executou a tarefa.",
+    "chunk_size": "Tamanho de lote (linhas por fetchmany) ao final da última execução.",
+    "execucoes_evitadas": "Execuções sem escrita por detectar_alteracoes (conteudo) ou consulta_verificacao (sonda).",
+}
+
+
+def pico_rss_bytes():
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é informado em KiB no Linux e em bytes no macOS.
+    return pico if sys.platform == "darwin" else pico * 1024
+
+
+def bytes_escritos(path, desde_ts):
+    if os.path.isfile(path):
+        arquivos = [path]
+    elif os.path.isdir(path):
+        arquivos = [os.path.join(raiz, a) for raiz, _, nomes in os.walk(path) for a in nomes]
+    else:
+        return 0
+
+    total = 0
+    for arquivo in arquivos:
+        try:
+            info = os.stat(arquivo)
+        except OSError:
+            continue
+        if info.st_mtime >= desde_ts:
+            total += info.st_size
+    return total
+
+
+class ResultadoTarefa:
+    # Volta do worker (thread ou processo) para o loop principal; avalia como o sucesso da tarefa.
+    def __init__(self, sucesso, metricas):
+        self.sucesso = bool(sucesso)
+        self.metricas = metricas
+
+    def __bool__(self):
+        return self.sucesso
+
+
+class MetricasExecucao:
+    def __init__(self, tarefa):
+        self.tarefa = tarefa["tabela"]
+        self.id_tarefa = identificador_tarefa(tarefa)
+        self.formato = tarefa.get("formato_saida", "xlsx")
+        self.inicio = time.time()
+        self._inicio_perf = time.perf_counter()
+        self.primeira_linha = None
+        self.linhas = 0
+        self.lote = {}
+        self.evitada = None
+        self.duracoes = {"busca": 0.0, "transformacao": 0.0, "espera": 0.0, "escrita": 0.0}
+        self._lock = threading.Lock()
+
+    def acumular(self, etapa, segundos):
+        with self._lock:
+            self.duracoes[etapa] += segundos
+
+    def medir_iterador(self, iterador, etapa):
+        iterador = iter(iterador)
+        try:
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    item = next(iterador)
+                except StopIteration:
+                    return
+                finally:
+                    self.acumular(etapa, time.perf_counter() - t0)
+                yield item
+        finally:
+            close = getattr(iterador, "close", None)
+            if close:
+                close()
+
+    def medir_funcao(self, funcao, etapa):
+        def medida(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                self.acumular(etapa, time.perf_counter() - t0)
+        return medida
+
+    def marcar_primeira_linha(self):
+        if self.primeira_linha is None:
+            self.primeira_linha = time.perf_counter() - self._inicio_perf
+
+    def registrar_lote(self, chunk_size):
+        resumo = getattr(chunk_size, "resumo", None)
+        self.lote = resumo() if resumo else {"chunk_size": chunk_size}
+        if resumo:
+            logging.info(f"Lote automático de '{self.tarefa}': {self.lote}")
+
+    def contar_linhas(self, chunks):
+        for chunk in chunks:
+            self.linhas += len(chunk)
+            yield chunk
+
+    def medir_escrita(self, escrever, chunks):
+        # O tempo de escrita desconta o tempo em que o escritor ficou esperando pelos chunks.
+        t0 = time.perf_counter()
+        espera_antes = self.duracoes["espera"]
+        try:
+            return escrever(self.medir_iterador(self.contar_linhas(chunks), "espera"))
+        finally:
+            decorrido = time.perf_counter() - t0
+            self.acumular("escrita", decorrido - (self.duracoes["espera"] - espera_antes))
+
+    def finalizar(self, sucesso, path):
+        total = time.perf_counter() - self._inicio_perf
+        duracoes = {
+            "primeira_linha": self.primeira_linha,
+            "busca": self.duracoes["busca"],
+            "transformacao": self.duracoes["transformacao"],
+            "escrita": self.duracoes["escrita"],
+            "total": total,
+        }
+        metricas = {
+            "tarefa": self.tarefa,
+            "id_tarefa": self.id_tarefa,
+            "formato": self.formato,
+            "inicio": datetime.datetime.fromtimestamp(self.inicio).isoformat(timespec="seconds"),
+            "sucesso": bool(sucesso),
+            "linhas": self.linhas,
+            "linhas_por_segundo": round(self.linhas / total, 1) if total > 0 else None,
+            "bytes_escritos": bytes_escritos(path, self.inicio) if sucesso else 0,
+            "rss_pico_bytes": pico_rss_bytes(),
+            "pid": os.getpid(),
+            "evitada": self.evitada,
+            **self.lote,
+            "duracoes": {etapa: round(v, 4) if v is not None else None for etapa, v in duracoes.items()},
+        }
+        return ResultadoTarefa(sucesso, metricas)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in sorted(rotulos.items())) + "}"
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self._gauges = {}
+        self._histogramas = {}
+
+    def incrementar(self, nome, rotulos, valor=1):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def definir(self, nome, rotulos, valor):
+        with self._lock:
+            self._gauges[(nome, tuple(sorted(rotulos.items())))] = valor
+
+    def observar(self, nome, rotulos, valor):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            hist = self._histogramas.setdefault(chave, {"buckets": [0] * len(BUCKETS_DURACAO), "soma": 0.0, "contagem": 0})
+            for i, limite in enumerate(BUCKETS_DURACAO):
+                if valor <= limite:
+                    hist["buckets"][i] += 1
+            hist["soma"] += valor
+            hist["contagem"] += 1
+
+    def registrar_execucao(self, metricas, atraso=None):
+        tarefa = {"tarefa": metricas["tarefa"], "formato": metricas["formato"]}
+        resultado = "sucesso" if metricas["sucesso"] else "falha"
+        self.incrementar("execucoes", {**tarefa, "resultado": resultado})
+        self.incrementar("linhas", tarefa, metricas["linhas"])
+        self.incrementar("bytes_escritos", tarefa, metricas["bytes_escritos"])
+        if metricas.get("evitada"):
+            self.incrementar("execucoes_evitadas", {**tarefa, "motivo": metricas["evitada"]})
+        for etapa, segundos in metricas["duracoes"].items():
+            if segundos is not None:
+                self.observar("duracao_segundos", {**tarefa, "etapa": etapa}, segundos)
+        if atraso is not None:
+            self.observar("atraso_agendamento_segundos", tarefa, max(0.0, atraso))
+        if metricas["linhas_por_segundo"] is not None:
+            self.definir("linhas_por_segundo", tarefa, metricas["linhas_por_segundo"])
+        if metricas.get("chunk_size") is not None:
+            self.definir("chunk_size", tarefa, metricas["chunk_size"])
+        if metricas["rss_pico_bytes"] is not None:
+            self.definir("rss_pico_bytes", {"pid": metricas["pid"]}, metricas["rss_pico_bytes"])
+
+    def exportar(self):
+        with self._lock:
+            contadores = dict(self._contadores)
+            gauges = dict(self._gauges)
+            histogramas = {k: {"buckets": list(v["buckets"]), "soma": v["soma"], "contagem": v["contagem"]} for k, v in self._histogramas.items()}
+
+        linhas = []
+
+        def cabecalho(nome, tipo):
+            linhas.append(f"# TYPE {PREFIXO}_{nome} {tipo}")
+            linhas.append(f"# HELP {PREFIXO}_{nome} {DESCRICOES.get(nome, nome)}")
+
+        for nome in sorted({n for n, _ in contadores}):
+            cabecalho(nome, "counter")
+            for (n, rotulos), valor in sorted(contadores.items()):
+                if n == nome:
+                    linhas.append(f"{PREFIXO}_{nome}_total{_rotulos(dict(rotulos))} {valor}")
+
+        for nome in sorted({n for n, _ in gauges}):
+            cabecalho(nome, "gauge")
+            for (n, rotulos), valor in sorted(gauges.items()):
+                if n == nome:
+                    linhas.append(f"{PREFIXO}_{nome}{_rotulos(dict(rotulos))} {valor}")
+
+        for nome in sorted({n for n, _ in histogramas}):
+            cabecalho(nome, "histogram")
+            for (n, rotulos), hist in sorted(histogramas.items()):
+                if n != nome:
+                    continue
+                rotulos = dict(rotulos)
+                for limite, quantidade in zip(BUCKETS_DURACAO, hist["buckets"]):
+                    linhas.append(f"{PREFIXO}_{nome}_bucket{_rotulos({**rotulos, 'le': limite})} {quantidade}")
+                linhas.append(f"{PREFIXO}_{nome}_bucket{_rotulos({**rotulos, 'le': '+Inf'})} {hist['contagem']}")
+                linhas.append(f"{PREFIXO}_{nome}_sum{_rotulos(rotulos)} {hist['soma']}")
+                linhas.append(f"{PREFIXO}_{nome}_count{_rotulos(rotulos)} {hist['contagem']}")
+
+        linhas.append("# EOF")
+        return "\n".join(linhas) + "\n"
+
+
+REGISTRO = RegistroMetricas()
+_log_lock = threading.Lock()
+
+
+def _gravar_log_execucao(registro):
+    destino = METRICAS["log_execucoes"]
+    if not destino:
+        return
+    try:
+        with _log_lock:
+            diretorio = os.path.dirname(destino)
+            if diretorio:
+                os.makedirs(diretorio, exist_ok=True)
+            with open(destino, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logging.warning(f"Não foi possível gravar o log de execuções em '{destino}': {e}")
+
+
+def registrar_resultado(resultado, atraso=None):
+    metricas = getattr(resultado, "metricas", None)
+    if not metricas:
+        return
+    REGISTRO.registrar_execucao(metricas, atraso)
+    registro = dict(metricas)
+    if atraso is not None:
+        registro["atraso_agendamento"] = round(atraso, 3)
+    _gravar_log_execucao(registro)
+
+    duracoes = metricas["duracoes"]
+    logging.info(
+        f"Métricas de '{metricas['tarefa']}': linhas={metricas['linhas']}, "
+        f"linhas/s={metricas['linhas_por_segundo']}, primeira linha={duracoes['primeira_linha']}s, "
+        f"busca={duracoes['busca']}s, transformação={duracoes['transformacao']}s, escrita={duracoes['escrita']}s, "
+        f"total={duracoes['total']}s, bytes={metricas['bytes_escritos']}"
+    )
+
+
+class _ManipuladorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        corpo = REGISTRO.exportar().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE_OPENMETRICS)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Endpoint de métricas: {format % args}")
+
+
+def iniciar_servidor_metricas():
+    porta = METRICAS["porta"]
+    if not porta:
+        return None
+    try:
+        servidor = ThreadingHTTPServer((METRICAS["endereco"], porta), _ManipuladorMetricas)
+    except OSError as e:
+        logging.error(f"Não foi possível iniciar o endpoint de métricas em {METRICAS['endereco']}:{porta}: {e}")
+        return None
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="metricas-http", daemon=True).start()
+    logging.info(f"Endpoint de métricas disponível em http://{METRICAS['endereco']}:{porta}/metrics")
+    return servidor
@@ -1,23 +1,257 @@
 import datetime
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+import zlib
 from config.settings import HORARIO_PERMITIDO
 
+ALIASES_CRON = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+CAMPOS_CRON = (
+    ("minuto", 0, 59),
+    ("hora", 0, 23),
+    ("dia", 1, 31),
+    ("mes", 1, 12),
+    ("dia_semana", 0, 7),
+)
+MAX_OCORRENCIAS_FORA_JANELA = 10000
+
+
+class JanelaExecucao:
+    def __init__(self, config=None):
+        config = config or {}
+        self.dias = set(config.get("dias", HORARIO_PERMITIDO["dias"]))
+        self.hora_inicio = int(config.get("hora_inicio", HORARIO_PERMITIDO["hora_inicio"]))
+        self.hora_fim = int(config.get("hora_fim", HORARIO_PERMITIDO["hora_fim"]))
+        if not self.dias or self.hora_inicio >= self.hora_fim:
+            raise ValueError(f"Janela de execução vazia: dias={sorted(self.dias)}, {self.hora_inicio}h-{self.hora_fim}h.")
+
+    def contem(self, dt):
+        return dt.weekday() in self.dias and self.hora_inicio <= dt.hour < self.hora_fim
+
+    def proximo_inicio(self, apos):
+        cur = apos.replace(minute=0, second=0, microsecond=0)
+        if cur.weekday() in self.dias and cur.hour < self.hora_inicio:
+            return cur.replace(hour=self.hora_inicio).timestamp()
+
+        for i in range(1, 8):
+            proximo_dia = cur + datetime.timedelta(days=i)
+            if proximo_dia.weekday() in self.dias:
+                return proximo_dia.replace(hour=self.hora_inicio).timestamp()
+
+        return (cur + datetime.timedelta(days=1)).replace(hour=self.hora_inicio).timestamp()
+
+    def ajustar(self, dt):
+        return dt.timestamp() if self.contem(dt) else self.proximo_inicio(dt)
+
+
+JANELA_GLOBAL = JanelaExecucao()
+
 def dentro_janela_permitida(now=None):
-    now = now or datetime.datetime.now()
-    if now.weekday() not in HORARIO_PERMITIDO['dias']:
-        return False
-    return HORARIO_PERMITIDO['hora_inicio'] <= now.hour < HORARIO_PERMITIDO['hora_fim']
+    return JANELA_GLOBAL.contem(now or datetime.datetime.now())
 
 def proxima_janela_inicio(after=None):
-    after = after or datetime.datetime.now()
-    cur = after.replace(minute=0, second=0, microsecond=0)
-    start_hour = HORARIO_PERMITIDO['hora_inicio']
-
-    if cur.weekday() in HORARIO_PERMITIDO['dias'] and cur.hour < start_hour:
-        return cur.replace(hour=start_hour).timestamp()
-
-    for i in range(1, 8):
-        next_day = cur + datetime.timedelta(days=i)
-        if next_day.weekday() in HORARIO_PERMITIDO['dias']:
-            return next_day.replace(hour=start_hour).timestamp()
-            
-    return (cur + datetime.timedelta(days=1)).replace(hour=start_hour).timestamp()
\ No newline at end of file
+    return JANELA_GLOBAL.proximo_inicio(after or datetime.datetime.now())
+
+
+def _valores_campo_cron(texto, minimo, maximo):
+    valores = set()
+    for parte in texto.split(","):
+        passo = 1
+        if "/" in parte:
+            parte, passo = parte.split("/", 1)
+            passo = int(passo)
+        if parte == "*":
+            inicio, fim = minimo, maximo
+        elif "-" in parte:
+            inicio, fim = (int(v) for v in parte.split("-", 1))
+        else:
+            inicio = int(parte)
+            fim = maximo if passo > 1 else inicio
+        if passo < 1 or inicio < minimo or fim > maximo or inicio > fim:
+            raise ValueError(f"Campo de cron '{texto}' fora do intervalo {minimo}-{maximo}.")
+        valores.update(range(inicio, fim + 1, passo))
+    return valores
+
+
+class ExpressaoCron:
+    # Cron de 5 campos (minuto hora dia mês dia-da-semana, domingo = 0 ou 7), com *, listas, faixas e passos.
+    def __init__(self, expressao):
+        self.expressao = expressao
+        campos = ALIASES_CRON.get(expressao.strip(), expressao).split()
+        if len(campos) != len(CAMPOS_CRON):
+            raise ValueError(f"Expressão cron '{expressao}' inválida: são esperados 5 campos.")
+
+        valores = {}
+        for texto, (nome, minimo, maximo) in zip(campos, CAMPOS_CRON):
+            try:
+                valores[nome] = _valores_campo_cron(texto, minimo, maximo)
+            except ValueError as e:
+                raise ValueError(f"Expressão cron '{expressao}' inválida: {e}") from None
+        self.minutos = valores["minuto"]
+        self.horas = valores["hora"]
+        self.dias = valores["dia"]
+        self.meses = valores["mes"]
+        self.dias_semana = {d % 7 for d in valores["dia_semana"]}
+        self.dia_restrito = campos[2] != "*"
+        self.dia_semana_restrito = campos[4] != "*"
+
+    def _dia_valido(self, dt):
+        dia_mes = dt.day in self.dias
+        dia_semana = (dt.weekday() + 1) % 7 in self.dias_semana
+        if self.dia_restrito and self.dia_semana_restrito:
+            return dia_mes or dia_semana
+        return dia_mes and dia_semana
+
+    def proxima(self, apos):
+        dt = apos.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limite = apos + datetime.timedelta(days=366 * 5)
+        while dt <= limite:
+            if dt.month not in self.meses:
+                dt = (dt.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self._dia_valido(dt):
+                dt = dt.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif dt.hour not in self.horas:
+                dt = dt.replace(minute=0) + datetime.timedelta(hours=1)
+            elif dt.minute not in self.minutos:
+                dt += datetime.timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError(f"Expressão cron '{self.expressao}' não tem ocorrências nos próximos 5 anos.")
+
+
+class AgendaTarefa:
+    # Agenda de uma tarefa, interpretada uma única vez a cada carga do tarefas.json.
+    def __init__(self, config):
+        self.horarios = sorted(datetime.datetime.strptime(h, '%H:%M').time() for h in config.get("horarios_execucao") or [])
+        self.cron = ExpressaoCron(config["cron"]) if config.get("cron") else None
+        self.intervalo = config.get("intervalo", 300)
+        self.janela = JanelaExecucao(config.get("janela"))
+
+    def _proximo_horario(self, apos):
+        # Um horário fora da janela não é descartado: a execução fica para a próxima abertura da janela.
+        for i in range(2):
+            dia = apos.date() + datetime.timedelta(days=i)
+            for horario in self.horarios:
+                candidato = datetime.datetime.combine(dia, horario)
+                if candidato > apos:
+                    return self.janela.ajustar(candidato)
+
+    def _proximo_cron(self, apos):
+        dt = apos
+        for _ in range(MAX_OCORRENCIAS_FORA_JANELA):
+            dt = self.cron.proxima(dt)
+            if self.janela.contem(dt):
+                return dt.timestamp()
+        raise ValueError(f"A expressão cron '{self.cron.expressao}' não tem ocorrências dentro da janela de execução da tarefa.")
+
+    def proxima_agendada(self, apos):
+        if self.cron:
+            return self._proximo_cron(apos)
+        return self._proximo_horario(apos)
+
+    def primeira_execucao(self, agora, jitter=0, chave=None):
+        if self.cron or self.horarios:
+            return self.proxima_agendada(agora)
+        # Tarefas por intervalo começam com um atraso, para que não disparem todas juntas. Com uma chave (o arquivo
+        # de saída), o atraso é fixo por chave: planilhas do mesmo workbook continuam vencendo juntas.
+        fracao = zlib.crc32(chave.encode('utf-8')) / 2 ** 32 if chave is not None else random.random()
+        atraso = fracao * min(jitter, self.intervalo) if jitter else 0
+        inicio = datetime.datetime.fromtimestamp(self.janela.ajustar(agora)) + datetime.timedelta(seconds=atraso)
+        return self.janela.ajustar(inicio)
+
+    def proxima_execucao(self, inicio):
+        if self.cron or self.horarios:
+            return self.proxima_agendada(inicio)
+        return self.janela.ajustar(inicio + datetime.timedelta(seconds=self.intervalo))
+
+    def nova_tentativa(self, inicio, espera):
+        return self.janela.ajustar(inicio + datetime.timedelta(seconds=espera))
+
+
+class Agendador:
+    # Fila de prioridade das próximas execuções. O loop principal dorme até a tarefa mais próxima
+    # ou até ser despertado (tarefa concluída, tarefas.json alterado, sinal de recarga ou encerramento).
+    def __init__(self):
+        self._fila = []
+        self._sequencia = itertools.count()
+        self._evento = threading.Event()
+        self.recarga_solicitada = False
+        self.encerramento_solicitado = False
+
+    def agendar(self, item):
+        if item.get('cancelado'):
+            return
+        heapq.heappush(self._fila, (item['proxima_execucao'], next(self._sequencia), item))
+
+    def cancelar(self, item):
+        # Remoção preguiçosa: o item sai da fila quando chegar ao topo e, se estiver em execução,
+        # não volta a ser agendado ao terminar.
+        item['cancelado'] = True
+
+    def retirar_vencidos(self, agora_ts):
+        vencidos = []
+        while self._fila and self._fila[0][0] <= agora_ts:
+            item = heapq.heappop(self._fila)[2]
+            if not item.get('cancelado'):
+                vencidos.append(item)
+        return vencidos
+
+    def proximo(self):
+        while self._fila and self._fila[0][2].get('cancelado'):
+            heapq.heappop(self._fila)
+        return self._fila[0][2] if self._fila else None
+
+    def aguardar(self, ate_ts):
+        espera = None if ate_ts is None else max(0.0, ate_ts - time.time())
+        despertado = self._evento.wait(espera)
+        self._evento.clear()
+        return despertado
+
+    def despertar(self):
+        self._evento.set()
+
+    def solicitar_recarga(self):
+        self.recarga_solicitada = True
+        self._evento.set()
+
+    def solicitar_encerramento(self):
+        self.encerramento_solicitado = True
+        self._evento.set()
+
+
+class ObservadorArquivo:
+    def __init__(self, path, ao_alterar, intervalo=5):
+        self.path = path
+        self.ao_alterar = ao_alterar
+        self.intervalo = intervalo
+        self._assinatura = self._ler_assinatura()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._observar, name="observador-tarefas", daemon=True)
+        self._thread.start()
+
+    def _ler_assinatura(self):
+        try:
+            info = os.stat(self.path)
+            return (info.st_mtime_ns, info.st_size)
+        except OSError:
+            return None
+
+    def _observar(self):
+        while not self._parar.wait(self.intervalo):
+            assinatura = self._ler_assinatura()
+            if assinatura != self._assinatura:
+                self._assinatura = assinatura
+                logging.info(f"Alteração detectada em '{self.path}'.")
+                self.ao_alterar()
+
+    def parar(self):
+        self._parar.set()